@@ -1,81 +1,85 @@
 import streamlit as st
+import functools
 import os
-import json
+import statistics
 import time
 from datetime import datetime
-from aip import AipSpeech
 import config
-import pandas as pd
-import re
+from tts_cache import TTSCache
+from tts_backends import make_client
+from synthesis import chunk_kwargs, segment_filename, synthesize_book
+from text_split import pack_report, split_text
+import job_queue
+import book_reader
+import chapters
+import playback_store
+import prefetch
+import search_index
+import media_server
+from player_component import render_export_link, render_player
+from library_index import LibraryIndex
+from contextlib import closing
 from urllib.parse import urlparse, parse_qs
 from user_config import (
     init_user_config, verify_user, update_user_password, 
-    get_user_info, update_last_login, load_user_config
+    update_last_login, issue_session_token, verify_session_token
 )
 
-# ----------- 1. 文本分段（同前） -----------
-def split_text(text: str, max_bytes: int = 1800) -> list[str]:
-    text = text.lstrip('\ufeff').strip()
-    if not text:
-        return []
-    sentences = re.findall(r'[^。！？\.\?\!]*[。！？\.\?\!]?', text, flags=re.S)
-    sentences = [s.strip() for s in sentences if s.strip()]
-    sentences = [s for s in sentences if re.search(r'[\u4e00-\u9fa5a-zA-Z0-9]', s)]
-    if not sentences:
-        return [text] if len(text.encode('utf-8')) <= max_bytes else []
-    chunks, buf, buf_len = [], '', 0
-    for sent in sentences:
-        l = len(sent.encode('utf-8'))
-        if buf_len + l <= max_bytes:
-            buf, buf_len = buf + sent, buf_len + l
-        else:
-            if buf:
-                chunks.append(buf)
-            buf, buf_len = sent, l
-    if buf:
-        chunks.append(buf)
-    return chunks
-
-
 # ----------- 2. 仅合成，不落盘 -----------
 # ----------- 新增：仅分段合成 MP3，不合并 -----------
-def generate_segments_mp3(text: str, voice_type: int, base_name: str, voice_name: str):
+def generate_segments_mp3(text: str, voice_type: int, base_name: str, voice_name: str,
+                          workers: int | None = None):
     """
-    每段 ≤1800 字节，输出 mp3（aue=6），不合并
+    每段不超过 config.TTS_MAX_BYTES，输出 mp3（aue=6），不合并
+    合成核心见 synthesis.synthesize_book：并发、缓存、重试与断点续传，
+    这里只负责把进度和结果展示在页面上
     返回 List[文件名]
     """
-    client = init_baidu_tts()
-    # 1=wav(带RIFF头)  3/4=裸pcm  6=mp3
-    options = {'spd': 5, 'pit': 5, 'vol': 5, 'per': voice_type, 'aue': 6}
-    chunks = split_text(text, max_bytes=1400)
+    stats = {}
+    chunks = split_text(text, stats=stats, **chunk_kwargs())
     if not chunks:
         st.error("拆分后没有有效段落！")
         return []
-    
-    os.makedirs(config.AUDIO_FILES_DIR, exist_ok=True)
-    files = []
 
-    for idx, seg in enumerate(chunks, 1):
-        try:
-            result = client.synthesis(seg, 'zh', 1, options)
-            st.write(f'一共有{len(chunks)}段，第{idx}段的汉字数为{len(seg)}个')
-        except Exception as e:
-            st.error(f"第 {idx} 段网络异常：{e}")
-            return []
-
-        # 硬拦截
-        if isinstance(result, dict):
-            st.error(f"第 {idx} 段合成失败：{result}")
-            return False
-        if len(result) < 100 or not result.startswith(b'RIFF'):
-            st.error(f"第 {idx} 段不是合法 mp3，前4字节={result[:4]} 长度={len(result)}")
-            return False
-
-        fname = f"{base_name}_{voice_name}_seg{idx:03d}.mp3"
-        fpath = os.path.join(config.AUDIO_FILES_DIR, fname)
-        with open(fpath, 'wb') as f:
-            f.write(result)
-        files.append(fname)
+    progress = st.progress(0.0)
+    counts = {'done': 0, 'cache': 0, 'api': 0}
+
+    # 回调在脚本线程中执行，可以直接调用 st.*
+    def on_progress(idx, total, seg, source):
+        counts[source] += 1
+        if source == 'done':
+            return
+        st.write(f'一共有{total}段，第{idx}段的汉字数为{len(seg)}个')
+        progress.progress(sum(counts.values()) / total)
+
+    files, error = synthesize_book(
+        chunks, voice_type, base_name, voice_name,
+        client=init_baidu_tts(), cache=get_tts_cache(),
+        workers=workers, on_progress=on_progress,
+    )
+    if counts['done']:
+        st.info(f"断点续传：跳过已完成的 {counts['done']} 段")
+    if error:
+        st.error(error)
+        st.warning(f"已完成的 {sum(counts.values())} 段已记录，再次合成将从缺失的分段继续")
+        return []
+    report = pack_report(stats, config.TTS_MAX_BYTES)
+    st.caption(
+        f"分段：{report['requests']} 次请求（整句分段需 {report['baseline_requests']} 次，"
+        f"节省 {report['saved_requests']} 次）| 平均填充率 {report['fill_ratio']:.0%}"
+    )
+    stats = get_tts_cache().stats()
+    st.caption(
+        f"TTS 缓存：命中 {stats['hits']} | 未命中 {stats['misses']} | 淘汰 {stats['evictions']} | "
+        f"占用 {stats['size_bytes'] / 1024 / 1024:.1f}/{stats['max_bytes'] / 1024 / 1024:.0f} MB"
+    )
+    client = init_baidu_tts()
+    if hasattr(client, 'stats'):
+        st.caption("凭证池：" + " | ".join(
+            f"{c['name']} {c['rate']:g}/{c['max_rate']:g} QPS，{c['calls']} 次，限流 {c['throttled']} 次"
+            + ("（配额已用完）" if c['paused'] else "")
+            for c in client.stats()
+        ))
     return files
 
 
@@ -92,13 +96,15 @@ def save_segments(segments, base_name: str):
         files.append(fname)
     return files
 
-# 初始化用户配置
-init_user_config()
-
 # 用户认证配置
 def is_user_logged_in():
-    """检查用户是否已登录"""
-    return st.session_state.get('logged_in', False)
+    """检查用户是否已登录：只验证会话令牌的签名与有效期，不读取用户文件"""
+    claims = verify_session_token(st.session_state.get('session_token'))
+    if claims is None:
+        return False
+    st.session_state.username = claims['user']
+    st.session_state.user_claims = claims
+    return True
 
 def show_login_page():
     """显示登录界面"""
@@ -122,10 +128,12 @@ def show_login_page():
             submit_button = st.form_submit_button("登录", type="primary")
             
             if submit_button:
+                # 首次登录时才创建用户配置文件
+                init_user_config()
                 if verify_user(username, password):
-                    st.session_state.logged_in = True
-                    st.session_state.username = username
                     update_last_login(username)
+                    st.session_state.session_token = issue_session_token(username)
+                    st.session_state.username = username
                     st.success(f"✅ 登录成功！欢迎 {username}")
                     time.sleep(1)  # 给用户时间看到成功消息
                     st.rerun()
@@ -141,15 +149,9 @@ def show_login_page():
 
 def logout():
     """用户登出"""
+    # 清除会话令牌与所有会话状态
     for key in list(st.session_state.keys()):
-        if key != 'logged_in' and key != 'username':  # 保留关键状态
-            del st.session_state[key]
-    
-    # 清除登录状态
-    if 'logged_in' in st.session_state:
-        del st.session_state['logged_in']
-    if 'username' in st.session_state:
-        del st.session_state['username']
+        del st.session_state[key]
     
     st.rerun()
 
@@ -194,7 +196,8 @@ def show_user_sidebar():
         st.markdown("---")
         
         username = st.session_state.get('username', '')
-        user_info = get_user_info(username)
+        # 角色与最后登录时间取自会话令牌，rerun 时不读用户文件
+        user_info = st.session_state.get('user_claims')
         
         if user_info:
             st.markdown(f"👤 **当前用户:** {username}")
@@ -213,10 +216,57 @@ def show_user_sidebar():
             if st.button("🔑 修改密码", key="change_pwd_btn"):
                 st.session_state.show_change_password = True
 
-# 初始化百度TTS客户端
+# 记录每次整页 / 片段 rerun 的耗时（本会话最近 RERUN_TIMING_HISTORY 次）
+def timed(scope: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                log = st.session_state.setdefault('rerun_timings', [])
+                log.append({'时间': datetime.now().strftime('%H:%M:%S'), '范围': scope,
+                            '耗时(ms)': round((time.perf_counter() - t0) * 1000, 1)})
+                del log[:-config.RERUN_TIMING_HISTORY]
+        return wrapper
+    return decorator
+
+# 侧边栏耗时面板：刷新按钮只重跑面板本身
+@st.fragment
+def show_rerun_timings():
+    with st.expander("⏱️ 渲染耗时"):
+        log = st.session_state.get('rerun_timings', [])
+        if not log:
+            st.caption("暂无记录")
+            return
+        summary = {}
+        for item in log:
+            summary.setdefault(item['范围'], []).append(item['耗时(ms)'])
+        st.dataframe([{'范围': scope, '次数': len(ms), '中位数(ms)': statistics.median(ms), '最近(ms)': ms[-1]}
+                      for scope, ms in summary.items()], width='stretch', hide_index=True)
+        st.dataframe(log[::-1][:20], width='stretch', hide_index=True)
+        st.button("刷新", key="refresh_rerun_timings")
+
+# 初始化百度TTS客户端（config.TTS_BACKEND = 'fake' 时为本地模拟后端）
 @st.cache_resource
 def init_baidu_tts():
-    return AipSpeech(config.APP_ID, config.API_KEY, config.SECRET_KEY)
+    # 百度 SDK 只在合成时用到，由 make_client 延迟导入
+    return make_client()
+
+# 播放器旁路服务（位置自动存档），每个进程只启动一次
+@st.cache_resource
+def get_media_server():
+    try:
+        return media_server.start_server()
+    except OSError as e:
+        print(f"播放器旁路服务启动失败: {e}")
+        return None
+
+# TTS 音频缓存（进程内共享，计数跨会话累计）
+@st.cache_resource
+def get_tts_cache():
+    return TTSCache()
 
 # 获取txt文件列表
 def get_txt_files():
@@ -227,21 +277,19 @@ def get_txt_files():
                 txt_files.append(file)
     return sorted(txt_files)
 
-# 获取音频文件列表
+# 音频库索引（进程内共享，目录 mtime 变化时才重新扫描）
+@st.cache_resource
+def get_library():
+    return LibraryIndex()
+
+# 获取音频文件列表（按书、音色、分段号排序）
 def get_audio_files():
-    audio_files = []
-    if os.path.exists(config.AUDIO_FILES_DIR):
-        for file in os.listdir(config.AUDIO_FILES_DIR):
-            if file.endswith('.mp3'):
-                audio_files.append(file)
-    return sorted(audio_files)
+    return get_library().refresh().files()
 
 # 读取txt文件内容
 def read_txt_file(filename):
-    file_path = os.path.join(config.BOOKS_DIR, filename)
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        return book_reader.read_book(filename)
     except Exception as e:
         st.error(f"读取文件失败: {e}")
         return None
@@ -250,52 +298,18 @@ def read_txt_file(filename):
 def get_audio_path(filename):
     return os.path.join(config.AUDIO_FILES_DIR, filename)
 
-# 加载播放记录
-def load_playback_records():
-    if os.path.exists(config.PLAYBACK_RECORDS_FILE):
-        try:
-            with open(config.PLAYBACK_RECORDS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
-
-# 保存播放记录
-def save_playback_records(records):
+# 更新播放记录：单条原子 upsert，不再整体重写记录文件
+def update_playback_record(audio_file, position=0, duration=0, status="playing"):
+    # 时长取自音频库索引（合成时已扫描帧头）
+    duration = duration or get_library().refresh().duration(audio_file)
     try:
-        with open(config.PLAYBACK_RECORDS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(records, f, ensure_ascii=False, indent=2)
+        return playback_store.update_record(
+            st.session_state.get('username', ''), audio_file,
+            position=position, duration=duration, status=status
+        )
     except Exception as e:
         st.error(f"保存播放记录失败: {e}")
-
-# 更新播放记录
-def update_playback_record(audio_file, position=0, duration=0, status="playing"):
-    records = load_playback_records()
-    
-    if audio_file not in records:
-        records[audio_file] = {
-            'last_played': datetime.now().isoformat(),
-            'play_count': 0,
-            'total_play_time': 0,
-            'last_position': 0,
-            'duration': duration,
-            'completed': False
-        }
-    
-    records[audio_file]['last_played'] = datetime.now().isoformat()
-    records[audio_file]['last_position'] = position
-    
-    if status == "completed":
-        records[audio_file]['completed'] = True
-        records[audio_file]['play_count'] += 1
-    elif status == "playing":
-        records[audio_file]['play_count'] += 1
-    
-    if duration > 0:
-        records[audio_file]['duration'] = duration
-    
-    save_playback_records(records)
-    return records[audio_file]
+        return None
 
 # 从URL参数获取当前播放位置
 def get_playback_position_from_url():
@@ -311,6 +325,7 @@ def get_playback_position_from_url():
 # 文本转语音界面
 def show_tts_interface():
     st.header("📝 文本转语音")
+    config.ensure_dirs()
     
     col1, col2 = st.columns([2, 1])
     
@@ -323,164 +338,338 @@ def show_tts_interface():
         selected_txt = st.selectbox("选择文本文件", txt_files, key="txt_selector")
         
         if selected_txt:
-            content = read_txt_file(selected_txt)
-            if content:
-                st.text_area("文本内容预览", content[:500] + "..." if len(content) > 500 else content, height=200)
+            # 预览只读开头几 KB；编码 / 大小 / 字数按 mtime 缓存
+            try:
+                preview = book_reader.read_preview(selected_txt, 500)
+                info = book_reader.get_book_info(selected_txt, count_chars=True)
+            except Exception as e:
+                st.error(f"读取文件失败: {e}")
+                preview = None
+            if preview:
+                st.text_area("文本内容预览", preview, height=200)
+                st.caption(f"编码：{info['encoding']} | 大小：{info['size'] / 1024:.1f} KB | 字数：{info['chars']}")
     
     with col2:
         voice_name = st.selectbox("选择音色", list(config.VOICE_OPTIONS.keys()), key="voice_selector")
         voice_type = config.VOICE_OPTIONS[voice_name]
-        if st.button("🎤 分段合成音频", type="primary"):
-            with st.spinner("正在分段合成 MP3..."):
-                content = read_txt_file(selected_txt)
-                if content:
-                    base_name = os.path.splitext(selected_txt)[0]
-                    files = generate_segments_mp3(content, voice_type, base_name, voice_name)
-                    if files:
-                        st.success(f"✅ 已生成 {len(files)} 段 MP3。")
-                        # for f in files:
-                        #     audio_path = os.path.join(config.AUDIO_FILES_DIR, f)
-                        #     with open(audio_path, 'rb') as af:
-                        #         st.audio(af, format='audio/mp3')
-                        #     st.download_button(label=f"下载 {f}", data=af,
-                        #                     file_name=f, mime='audio/mp3')
-                    else:
-                        st.error("分段合成失败")
-#
+        username = st.session_state.get('username', '')
+        with closing(job_queue.connect()) as conn:
+            workers_alive = job_queue.alive_workers(conn)
+            if st.button("🎤 分段合成音频", type="primary"):
+                job_id = job_queue.enqueue(conn, selected_txt, voice_name, username)
+                st.success(f"✅ 已加入后台合成队列（任务 #{job_id}）")
+            # 边听边合成：先合成开头几段，之后按收听进度预合成
+            if config.PREFETCH_AHEAD > 0 and st.button("⚡ 边听边合成",
+                                                       help=f"先合成前 {config.PREFETCH_AHEAD} 段，之后随收听进度保持领先 {config.PREFETCH_AHEAD} 段"):
+                job_id = job_queue.enqueue(conn, selected_txt, voice_name, username,
+                                           segments=(1, config.PREFETCH_AHEAD))
+                st.success(f"✅ 已加入后台合成队列（任务 #{job_id}），第 1 段合成后即可在播放器中收听")
+
+        if not workers_alive:
+            st.warning("⚠️ 未检测到后台合成进程，请在服务器上运行 `python worker.py`")
+            # 没有 worker 时保留在当前会话中直接合成的方式
+            if st.button("在当前页面直接合成", key="inline_synthesis"):
+                with st.spinner("正在分段合成 MP3..."):
+                    content = read_txt_file(selected_txt)
+                    if content:
+                        base_name = os.path.splitext(selected_txt)[0]
+                        files = generate_segments_mp3(content, voice_type, base_name, voice_name)
+                        if files:
+                            st.success(f"✅ 已生成 {len(files)} 段 MP3。")
+                            if config.CHAPTER_ASSEMBLY:
+                                try:
+                                    chapters.assemble_chapter(base_name, voice_name, files)
+                                except (ValueError, OSError) as e:
+                                    st.error(f"❌ 合并整章失败：{e}")
+                        else:
+                            st.error("分段合成失败")
+
+    show_synthesis_jobs(username)
+
+
+# 合成任务进度：只轮询任务表，不阻塞页面其他部分
+@st.fragment(run_every=config.JOB_POLL_SECONDS)
+def show_synthesis_jobs(username):
+    with closing(job_queue.connect()) as conn:
+        jobs = job_queue.list_jobs(conn, username)
+    if not jobs:
+        return
+    st.subheader("🗂️ 合成任务")
+    status_labels = {'queued': '⏳ 排队中', 'running': '🔄 合成中', 'done': '✅ 完成', 'failed': '❌ 失败'}
+    for job in jobs:
+        span = f"（第 {job['first_seg']}–{job['last_seg']} 段）" if job['first_seg'] else ''
+        label = f"#{job['id']} {job['book_file']} / {job['voice_name']}{span} — {status_labels[job['status']]}"
+        if job['status'] == 'running' and job['total']:
+            st.progress(job['done'] / job['total'], text=f"{label}（{job['done']}/{job['total']}）")
+        elif job['status'] == 'running':
+            st.caption(f"{label}（已完成 {job['done']} 段）")
+        else:
+            st.caption(label)
+        if job['error']:
+            st.caption(f"　{job['error']}")
+
+
+def select_audio(target: str):
+    st.query_params["f"] = target
+    st.query_params["t_live"] = "0"
 
 def show_player_interface():
     st.header("🎧 音频播放器")
+    config.ensure_dirs()
 
     # ---------- 0. 歌单 ----------
-    audio_files = get_audio_files()
-    if not audio_files:
+    library = get_library().refresh()
+    if not len(library):
         st.warning(f"📁 请在 {config.AUDIO_FILES_DIR} 文件夹中添加音频文件")
         return
+    first = library.entries[0].name
 
     # ---------- 1. 唯一数据源：URL ----------
     query = st.query_params
-    curr = query.get("f", audio_files[0])
-    if curr not in audio_files:
-        curr = audio_files[0]
-
-    # ---------- 2. 下拉框 ----------
-    idx = audio_files.index(curr)
-    new_file = st.selectbox(
-        "选择音频文件",
-        audio_files,
-        index=idx,
-        key=f"audio_selector_{curr}"
-    )
+    curr = query.get("f", first)
+    if curr not in library:
+        curr = first
+    entry = library.get(curr)
+
+    # ---------- 2. 下拉框：先选书目 / 音色，再选分段 ----------
+    group_keys = list(library.groups)
+    g1, g2 = st.columns([2, 1])
+    with g1:
+        group = st.selectbox(
+            "选择书目 / 音色",
+            group_keys,
+            index=group_keys.index((entry.book, entry.voice)),
+            format_func=lambda k: f"{k[0]} · {k[1]}" if k[1] else k[0],
+            key=f"group_selector_{curr}"
+        )
+    segments = library.groups[group]
+    with g2:
+        new_file = st.selectbox(
+            "选择分段",
+            [e.name for e in segments],
+            index=library.group_index(curr) if group == (entry.book, entry.voice) else 0,
+            format_func=lambda name: f"第 {library.get(name).segment} 段" if library.get(name).voice else name,
+            key=f"audio_selector_{curr}"
+        )
     if new_file != curr:                      # 用户手动切换
-        st.query_params["f"] = new_file
-        st.query_params["t_live"] = "0"
+        select_audio(new_file)
+
+    # 整章：分段已按帧拼接成一个文件时可以连续播放，段与段之间不再 rerun
+    own_group = [e.name for e in library.group_of(curr)]
+    chapter = chapters.load_chapter(entry.book, entry.voice, own_group) if entry.voice else None
+    chapter_mode = False
+    if entry.voice:
+        h1, h2 = st.columns([1, 3])
+        if chapter:
+            with h1:
+                chapter_mode = st.toggle("🧩 整章连续播放", key="chapter_mode",
+                                         on_change=lambda: st.query_params.update(t_live="0"))
+            with h2:
+                st.caption(f"整章 {len(chapter.segments)} 段 · {format_duration(chapter.duration)}")
+        else:
+            with h1:
+                if st.button("🧩 合并为整章"):
+                    with st.spinner("正在按帧拼接分段..."):
+                        try:
+                            chapters.assemble_chapter(entry.book, entry.voice, own_group)
+                        except (ValueError, OSError) as e:
+                            st.error(f"❌ 合并失败：{e}")
+                        else:
+                            st.rerun()
+    playing = chapter.data['file'] if chapter_mode else curr
+
+    # 按收听进度预合成：当前分段之后缺段时提交范围任务（由 worker 合成）
+    if entry.voice and not chapter_mode:
+        job_id = prefetch.ensure_ahead(library, entry.book, entry.voice, entry.segment,
+                                       st.session_state.get('username', ''))
+        if job_id:
+            st.caption(f"⚡ 正在预合成后续分段（任务 #{job_id}）")
+
+    # ---------- 3. 上一曲 / 下一曲 / 存档按钮（局部 rerun） ----------
+    show_player_controls(curr, playing)
+
+    # ---------- 5. 播放 + 记忆位置 + 自动存档 ----------
+    # 音频由旁路服务按 HTTP Range 分块提供，不再把整个 MP3 读进内存；
+    # 前端合并位置更新：每隔几秒、暂停 / 播完 / 关闭页面时发给旁路服务，
+    # 由服务端批量落库，不触发 Streamlit rerun
+    # 连续播放：前端预取同组的下一段，播完直接切换，同样不触发 rerun
+    continuous = False if chapter_mode else st.toggle("🔁 连续播放", key="continuous_play",
+                                                      help="播完自动接着播放同一书目 / 音色的下一段")
+    server = get_media_server()
+    if server is None:
+        # 旁路服务没能启动（端口被占用等）：退回 Streamlit 自带的播放器，从 URL / 已保存的位置起播；
+        # 没有自动存档、倍速与连续播放，位置用「保存位置」按钮手动存档
+        st.error(f"❌ 播放器旁路服务（端口 {config.MEDIA_SERVER_PORT}）启动失败，已改用基础播放器")
+        record = playback_store.get_record(st.session_state.get('username', ''), playing) or {}
+        start = get_playback_position_from_url() or (
+            chapter.time_of_segment(entry.segment) if chapter_mode else record.get('last_position', 0))
+        st.audio(get_audio_path(playing), format="audio/mp3", start_time=int(start))
+    else:
+        render_player({
+            'endpoint': config.MEDIA_SERVER_PUBLIC_URL,
+            'port': config.MEDIA_SERVER_PORT,
+            'token': media_server.position_token(st.session_state.get('username', '')),
+            'file': playing,
+            # 播放速度按书保存，由前端向旁路服务读取 / 保存
+            'book': playback_store.book_of(playing),
+            'speeds': config.SPEED_OPTIONS,
+            'interval': config.POSITION_SAVE_SECONDS * 1000,
+            # 整章模式下只在所选分段内沿用已保存的位置，否则从该段开头播放
+            'range': chapter.segment_range(entry.segment) if chapter_mode else None,
+            'continuous': continuous,
+            'playlist': own_group[library.group_index(curr):] if continuous else None,
+        })
+
+    # ---------- 7. 统计（随自动存档定时刷新） ----------
+    duration = chapter.duration if chapter_mode else library.duration(curr)
+    if chapter_mode:
+        pos = get_playback_position_from_url() or chapter.time_of_segment(entry.segment)
+        current = chapter.segment_at_time(pos)
+        st.caption(f"正在播放：第 {current['segment']} 段（{current['file']}）")
+    show_player_stats(playing, duration)
+
+    # ---------- 8. 播放列表（按书目 / 音色分组，定时刷新） ----------
+    if entry.voice and server is not None:
+        # 整本打包下载：旁路服务边读边发，不经过 Streamlit、不占内存
+        render_export_link({
+            'endpoint': config.MEDIA_SERVER_PUBLIC_URL,
+            'port': config.MEDIA_SERVER_PORT,
+            'token': media_server.position_token(st.session_state.get('username', '')),
+            'book': entry.book,
+            'voice': entry.voice,
+        }, f"📦 下载整本（{len(own_group)} 段 MP3 + 清单 / CUE / 播放记录，ZIP）")
+    show_playlist(curr)
+
+    # ---------- 9. 末尾：URL 变化 → rerun ----------
+    if st.query_params.get("f", first) != curr:
+        st.rerun()
 
-    # ---------- 3. 上一曲 / 下一曲 ----------
-    def jump(step: int):
-        idx = audio_files.index(curr)
-        target = audio_files[(idx + step) % len(audio_files)]
-        st.query_params["f"] = target
-        st.query_params["t_live"] = "0"
+# 以下三个片段各自局部 rerun：点按钮、定时刷新都不会重建播放器 iframe，
+# 也不会重新执行页面其余部分
 
+@st.fragment
+@timed("播放控制")
+def show_player_controls(curr: str, playing: str):
     c1, c2, c3, c4, c5 = st.columns(5)
     with c1:
-        st.button("⏮️ 上一曲", on_click=jump, args=(-1,))
+        prev_clicked = st.button("⏮️ 上一曲")
     with c2:
-        st.button("⏭️ 下一曲", on_click=jump, args=(1,))
+        next_clicked = st.button("⏭️ 下一曲")
+    if prev_clicked or next_clicked:
+        # 换曲需要重建播放器：整页 rerun
+        select_audio(get_library().refresh().neighbor(curr, -1 if prev_clicked else 1))
+        st.rerun()
 
-    # ---------- 4. 其余按钮 ----------
+    # ---------- 4. 其余按钮：只写自己改动的那条记录 ----------
     with c3:
         if st.button("💾 保存当前位置"):
             pos = get_playback_position_from_url()
             if pos > 0:
-                update_playback_record(curr, position=pos)
+                update_playback_record(playing, position=pos)
                 st.success(f"✅ 位置已保存：{pos:.1f}秒")
     with c4:
         if st.button("🔁 重置位置"):
-            update_playback_record(curr, position=0)
+            update_playback_record(playing, position=0)
             st.query_params["t_live"] = "0"
     with c5:
         if st.button("✅ 标记完成"):
-            update_playback_record(curr, status="completed")
+            update_playback_record(playing, status="completed")
             st.success("音频已标记为完成！")
 
-    # ---------- 5. 播放 ----------
-    audio_path = get_audio_path(curr)
-    st.audio(open(audio_path, "rb").read(), format="audio/mp3")
-
-    # ---------- 6. 记忆位置 ----------
-    records = load_playback_records()
-    jump_pos = get_playback_position_from_url() or records.get(curr, {}).get("last_position", 0)
-    js = f"""
-    <script>
-    (function(){{
-        const aud = parent.document.querySelector('audio');
-        if (!aud) return;
-        let jumped = false;
-        aud.addEventListener('play', () => {{
-            if (!jumped && {jump_pos} > 0) {{
-                aud.currentTime = {jump_pos};
-                jumped = true;
-            }}
-        }});
-        aud.addEventListener('timeupdate', () => {{
-            const t = aud.currentTime.toFixed(1);
-            const url = new URL(parent.location);
-            url.searchParams.set('t_live', t);
-            parent.history.replaceState(null, null, url);
-        }});
-        aud.addEventListener('ended', () => {{
-            const url = new URL(parent.location);
-            url.searchParams.set('t_live', '0');
-            parent.history.replaceState(null, null, url);
-        }});
-    }})();
-    </script>
-    """
-    st.components.v1.html(js, height=0)
-
-    # ---------- 7. 统计 ----------
-    record = records.get(curr, {})
+@st.fragment(run_every=config.POSITION_SAVE_SECONDS)
+@timed("播放统计")
+def show_player_stats(playing: str, duration: float):
+    # 按主键读一条记录，不再读取全部播放记录
+    record = playback_store.get_record(st.session_state.get('username', ''), playing) or {}
     st.caption(
         f"播放次数：{record.get('play_count', 0)} | "
         f"保存位置：{record.get('last_position', 0):.1f}秒 | "
+        f"时长：{duration:.1f}秒 | "
         f"状态：{'✅ 已完成' if record.get('completed') else '⏸️ 进行中'}"
     )
 
-    # ---------- 8. 播放列表 ----------
-    st.subheader("📋 播放列表")
+# 播放列表数据：以事件日志偏移（每次记录变化都会增加）与音频库目录版本为缓存键
+@st.cache_data(show_spinner=False, max_entries=64)
+def load_playlist_frames(username: str, curr: str, event_offset: int, library_stamp):
+    import pandas as pd
+
+    library = get_library().refresh()
+    records = playback_store.get_records(username)
     playlist_data = []
-    for audio in audio_files:
-        rec = records.get(audio, {})
+    for seg in library.group_of(curr):
+        rec = records.get(seg.name, {})
         playlist_data.append({
-            '文件名': audio,
+            '分段': seg.segment,
+            '文件名': seg.name,
             '播放次数': rec.get('play_count', 0),
             '最后播放': rec.get('last_played', '从未')[:10] if rec.get('last_played') else '从未',
             '状态': '✅ 完成' if rec.get('completed', False) else '⏸️ 进行中',
             '位置': f"{rec.get('last_position', 0):.1f}秒"
         })
-    st.dataframe(pd.DataFrame(playlist_data), width='stretch')
-
-    # ---------- 9. 末尾：URL 变化 → rerun ----------
-    if st.query_params.get("f", audio_files[0]) != curr:
-        st.rerun()
+    overview = []
+    for (book, voice), group_entries in library.groups.items():
+        overview.append({
+            '书目': book,
+            '音色': voice or '-',
+            '分段数': len(group_entries),
+            '已完成': sum(1 for e in group_entries if records.get(e.name, {}).get('completed')),
+        })
+    return pd.DataFrame(playlist_data), pd.DataFrame(overview)
+
+@st.fragment(run_every=config.PLAYLIST_REFRESH_SECONDS)
+@timed("播放列表")
+def show_playlist(curr: str):
+    library = get_library().refresh()
+    playlist, overview = load_playlist_frames(
+        st.session_state.get('username', ''), curr, playback_store.last_event_id(), library.stamp
+    )
+    st.subheader("📋 播放列表")
+    st.dataframe(playlist, width='stretch', hide_index=True)
+
+    with st.expander(f"📚 全部书目（{len(library.groups)} 组 / {len(library)} 段）"):
+        st.dataframe(overview, width='stretch', hide_index=True)
+
+def format_duration(seconds: float) -> str:
+    """秒数 → 1小时02分 / 3分05秒 / 28.8秒"""
+    if seconds >= 3600:
+        return f"{int(seconds // 3600)}小时{int(seconds % 3600 // 60):02d}分"
+    if seconds >= 60:
+        return f"{int(seconds // 60)}分{int(seconds % 60):02d}秒"
+    return f"{seconds:.1f}秒"
+
+# 统计页的数据只在事件日志有新事件时重新读取：缓存键为日志偏移
+@st.cache_data(show_spinner=False, max_entries=16)
+def load_stats_frames(username: str, event_offset: int):
+    import pandas as pd
+
+    records = pd.DataFrame.from_dict(playback_store.get_records(username), orient='index')
+    rollups = pd.DataFrame(
+        playback_store.get_rollups(username),
+        columns=['day', 'username', 'book', 'plays', 'completions', 'saves', 'listened'],
+    )
+    return records, rollups
 
 # 播放记录界面
 def show_playback_records():
+    # pandas 导入较慢（约 0.5 秒），只在打开统计页时加载
+    import pandas as pd
+
     st.header("📊 播放记录统计")
     
-    playback_records = load_playback_records()
+    username = st.session_state.get('username', '')
+    records, rollups = load_stats_frames(username, playback_store.last_event_id())
     
-    if not playback_records:
+    if records.empty:
         st.info("暂无播放记录")
         return
     
     col1, col2, col3, col4 = st.columns(4)
     
-    total_files = len(get_audio_files())
-    played_files = len([r for r in playback_records.values() if r['play_count'] > 0])
-    total_plays = sum(r['play_count'] for r in playback_records.values())
-    completed_files = len([r for r in playback_records.values() if r.get('completed', False)])
+    library = get_library().refresh()
+    total_files = len(library)
+    played_files = int((records['play_count'] > 0).sum())
+    total_plays = int(records['play_count'].sum())
+    completed_files = int(records['completed'].sum())
     completion_rate = (completed_files / total_files * 100) if total_files > 0 else 0
     
     with col1:
@@ -495,47 +684,66 @@ def show_playback_records():
     with col4:
         st.metric("完成率", f"{completion_rate:.1f}%")
     
-    st.subheader("📋 详细播放记录")
+    # 时长来自帧头扫描结果（媒体信息库缓存），不必解码音频
+    durations = pd.Series({e.name: library.duration(e.name) for e in library.entries}, dtype=float)
+    duration = durations.reindex(records.index).fillna(0)
+    duration = duration.where(duration > 0, records['duration'])
+    listened = records['last_position'].clip(upper=duration).where(duration > 0, 0)
+    listened = listened.mask(records['completed'], duration)
+    total_duration = durations.sum()
+    listened_duration = listened.sum()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("音频总时长", format_duration(total_duration))
+    with col2:
+        st.metric("已收听时长", format_duration(listened_duration))
+    with col3:
+        st.metric("收听进度", f"{listened_duration / total_duration * 100:.1f}%" if total_duration > 0 else "-")
+    with col4:
+        st.metric("损坏文件", sum(1 for e in library.entries if not (library.media_info(e.name) or {}).get('valid', True)))
     
-    records_data = []
-    for filename, record in playback_records.items():
-        records_data.append({
-            '文件名': filename,
-            '播放次数': record['play_count'],
-            '最后播放': record['last_played'][:16],
-            '播放位置': f"{record['last_position']:.1f}秒",
-            '音频时长': f"{record['duration']:.1f}秒" if record['duration'] > 0 else '未知',
-            '状态': '✅ 已完成' if record.get('completed', False) else '⏸️ 进行中'
-        })
+    st.subheader("📋 详细播放记录")
     
-    df = pd.DataFrame(records_data)
+    known = duration > 0
+    df = pd.DataFrame({
+        '文件名': records.index,
+        '播放次数': records['play_count'].to_numpy(),
+        '最后播放': records['last_played'].fillna('').str[:16].to_numpy(),
+        '播放位置': records['last_position'].map('{:.1f}秒'.format).to_numpy(),
+        '音频时长': duration.map('{:.1f}秒'.format).where(known, '未知').to_numpy(),
+        '完成度': (listened / duration * 100).where(known).map('{:.0f}%'.format).where(known, '-').to_numpy(),
+        '状态': records['completed'].map({True: '✅ 已完成', False: '⏸️ 进行中'}).to_numpy(),
+    })
     df = df.sort_values('最后播放', ascending=False)
     
     st.dataframe(df, width='stretch')
     
-    if len(records_data) > 1:
+    # 趋势与书目汇总读取增量维护的日汇总表，不再扫描播放记录
+    if not rollups.empty:
         st.subheader("📈 播放趋势")
         
-        date_plays = {}
-        for record in playback_records.values():
-            date = record['last_played'][:10]
-            date_plays[date] = date_plays.get(date, 0) + 1
+        daily = rollups.groupby('day')[['plays', 'completions', 'listened']].sum().sort_index()
+        daily['listened'] = daily['listened'] / 60
+        st.line_chart(daily.rename(columns={'plays': '播放次数', 'completions': '完成次数', 'listened': '收听分钟'}))
         
-        if date_plays:
-            chart_data = pd.DataFrame(
-                list(date_plays.items()),
-                columns=['日期', '播放次数']
-            ).sort_values('日期')
-            
-            st.line_chart(chart_data.set_index('日期'))
+        st.subheader("📚 按书目")
+        books = rollups.groupby('book').agg(
+            播放次数=('plays', 'sum'),
+            完成次数=('completions', 'sum'),
+            收听分钟=('listened', 'sum'),
+            最近收听=('day', 'max'),
+        ).sort_values('最近收听', ascending=False)
+        books['收听分钟'] = (books['收听分钟'] / 60).round(1)
+        st.dataframe(books, width='stretch')
     
     col1, col2 = st.columns(2)
     with col1:
-        if st.button("🗑️ 清空所有记录"):
-            if os.path.exists(config.PLAYBACK_RECORDS_FILE):
-                os.remove(config.PLAYBACK_RECORDS_FILE)
-                st.success("所有播放记录已清空！")
-                st.rerun()
+        # 只清空当前用户的记录；迁移来的公共旧记录所有用户可见，只有管理员能一并清空
+        is_admin = (st.session_state.get('user_claims') or {}).get('role') == 'admin'
+        if st.button("🗑️ 清空我的记录"):
+            playback_store.clear_records(username, include_legacy=is_admin)
+            st.success("你的播放记录已清空！")
+            st.rerun()
     
     with col2:
         if st.button("📊 导出记录"):
@@ -547,6 +755,48 @@ def show_playback_records():
                 mime="text/csv"
             )
 
+# 全文搜索：命中的分段直接跳到播放器
+def jump_to_hit(audio_file: str, position: float):
+    st.query_params["f"] = audio_file
+    st.query_params["t_live"] = f"{position:.1f}"
+    st.session_state.feature_selector = "音频播放器"
+
+def show_search_interface():
+    st.header("🔍 全文搜索")
+    config.ensure_dirs()
+    # 只重建新增 / 修改过的书，没有变化时几乎不耗时
+    with st.spinner("正在更新搜索索引..."):
+        stats = search_index.refresh()
+    if stats['indexed'] or stats['removed']:
+        st.caption(f"索引已更新：新建 / 重建 {stats['indexed']} 本，移除 {stats['removed']} 本")
+    if stats['failed']:
+        st.warning(f"⚠️ {stats['failed']} 本书建立索引失败，详见服务日志")
+
+    query = st.text_input("搜索书中的词句", key="search_query", placeholder="如：曾国藩")
+    if not query.strip():
+        return
+    t0 = time.perf_counter()
+    hits = search_index.search(query)
+    st.caption(f"找到 {len(hits)} 处（最多显示 {config.SEARCH_MAX_RESULTS} 处）· 用时 {(time.perf_counter() - t0) * 1000:.1f} 毫秒")
+
+    library = get_library().refresh()
+    for i, hit in enumerate(hits):
+        base_name = os.path.splitext(hit.book)[0]
+        files = [f for f in (segment_filename(base_name, voice, hit.segment) for voice in config.VOICE_OPTIONS)
+                 if f in library]
+        with st.container(border=True):
+            st.markdown(f"**{base_name}** · 第 {hit.segment} 段")
+            st.caption(hit.snippet)
+            if not files:
+                st.caption("该分段尚未合成")
+                continue
+            cols = st.columns(len(files))
+            for col, audio_file in zip(cols, files):
+                # 按短语在分段中的位置估算起播时间，提前 1 秒
+                position = max(0.0, library.duration(audio_file) * hit.offset / max(hit.chars, 1) - 1)
+                col.button(f"▶️ {library.get(audio_file).voice}", key=f"hit_{i}_{audio_file}",
+                           on_click=jump_to_hit, args=(audio_file, position))
+
 # 主界面
 def main():
     # 检查用户是否已登录
@@ -578,7 +828,7 @@ def main():
         st.header("📚 功能菜单")
         
         # 检查API配置
-        if config.APP_ID == 'your_app_id' or config.API_KEY == 'your_api_key':
+        if config.TTS_BACKEND == 'baidu' and (config.APP_ID == 'your_app_id' or config.API_KEY == 'your_api_key'):
             st.warning("⚠️ 请先配置百度TTS API凭证！")
             st.info("编辑 config.py 文件，填入你的百度AI平台凭证")
             return
@@ -586,18 +836,27 @@ def main():
         # 功能选择
         feature = st.radio(
             "选择功能",
-            ["音频播放器", "播放记录", "文本转语音"],
+            ["音频播放器", "播放记录", "文本转语音", "全文搜索"],
             key="feature_selector"
         )
     
     # 主内容区域
-    
+    show_feature(feature)
+
+    if config.RERUN_TIMINGS:
+        with st.sidebar:
+            show_rerun_timings()
+
+@timed("整页")
+def show_feature(feature: str):
     if feature == "音频播放器":
         show_player_interface()
     elif feature == "播放记录":
         show_playback_records()
     elif feature == "文本转语音":
         show_tts_interface()
+    elif feature == "全文搜索":
+        show_search_interface()
 
 if __name__ == "__main__":
     main()
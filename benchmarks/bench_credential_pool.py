@@ -0,0 +1,52 @@
+"""凭证池吞吐对比：单账号直连（限流即退避重试） vs CredentialPool（令牌桶 + AIMD）
+
+每个模拟账号是一个 FakeTTS：固定延迟、每秒最多 qps 个请求，超出时返回错误码 18。
+- direct：旧方式，一个客户端，限流错误交给 synthesize_with_retry 指数退避
+- pool×k：k 个账号组成的凭证池，总吞吐应随 k 线性增长、几乎不再触发限流
+
+用法：python benchmarks/bench_credential_pool.py [段数] [每账号QPS]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from synthesis import synthesize_book  # noqa: E402
+from tts_backends import CredentialPool, FakeTTS  # noqa: E402
+
+LATENCY = 0.05
+WORKERS = 16
+
+
+def run(label: str, client, accounts, segments: int):
+    chunks = [f"第{i}段，测试凭证池的吞吐。" for i in range(segments)]
+    with tempfile.TemporaryDirectory(prefix='qradio-pool-') as workdir:
+        os.chdir(workdir)
+        config.ensure_dirs()
+        t0 = time.perf_counter()
+        files, error = synthesize_book(chunks, 0, label, '女声', client=client, workers=WORKERS)
+        seconds = time.perf_counter() - t0
+    throttled = sum(a.throttled for a in accounts)
+    print(f"{label:<10}{len(files):>6} 段  {seconds:>7.2f}s  {len(files) / seconds:>7.1f} 段/秒  "
+          f"限流 {throttled:>5} 次  {error or ''}")
+
+
+def main():
+    segments = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    qps = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    config.TTS_BACKOFF_BASE = 0.5
+    print(f"{segments} 段，每账号 {qps} QPS，单次延迟 {LATENCY * 1000:.0f}ms，{WORKERS} 个合成线程")
+
+    account = FakeTTS(latency=LATENCY, frames_per_char=1, qps_limit=qps)
+    run('direct', account, [account], segments)
+    for k in (1, 2, 4):
+        accounts = [FakeTTS(latency=LATENCY, frames_per_char=1, qps_limit=qps) for _ in range(k)]
+        pool = CredentialPool([(f'acct{i}', a, qps) for i, a in enumerate(accounts)])
+        run(f'pool×{k}', pool, accounts, segments)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""音频流内存对比：整文件读入（旧 st.audio 方式） vs 旁路服务 Range 分块流
+
+模拟 N 个听众同时从各自保存的位置开始收听：
+- legacy：每个会话 open(path).read() 一份完整 MP3（Streamlit 媒体管理器会一直持有）
+- range：每个听众向 media_server 请求从保存位置起的一段 Range 数据
+
+用法：python benchmarks/bench_media_server.py [听众数] [文件MB数]
+"""
+import http.client
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+LISTEN_BYTES = 256 * 1024  # 每个听众本轮实际收听的数据量（约 16 秒 128kbps）
+
+
+def legacy(path: str, listeners: int):
+    held = [open(path, 'rb').read() for _ in range(listeners)]
+    return sum(len(b) for b in held)
+
+
+def ranged(port: int, name: str, size: int, listeners: int, token: str):
+    received = [0] * listeners
+    barrier = threading.Barrier(listeners)
+
+    def listen(i):
+        start = random.randrange(0, size - LISTEN_BYTES)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        barrier.wait()
+        conn.request('GET', f'/audio/{name}?token={token}',
+                     headers={'Range': f'bytes={start}-{start + LISTEN_BYTES - 1}'})
+        resp = conn.getresponse()
+        assert resp.status == 206, resp.status
+        while True:
+            block = resp.read(16 * 1024)
+            if not block:
+                break
+            received[i] += len(block)
+        conn.close()
+
+    threads = [threading.Thread(target=listen, args=(i,)) for i in range(listeners)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(received)
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    listeners = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    megabytes = float(sys.argv[2]) if len(sys.argv) > 2 else 8
+    with tempfile.TemporaryDirectory() as tmp:
+        config.AUDIO_FILES_DIR = tmp
+        config.PLAYBACK_DB = os.path.join(tmp, 'records.db')
+        import media_server
+
+        name = 'bench_女声_seg001.mp3'
+        path = os.path.join(tmp, name)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(int(megabytes * 1024 * 1024)))
+        size = os.path.getsize(path)
+
+        server, _ = media_server.start_server('127.0.0.1', 0)
+        port = server.server_address[1]
+        token = media_server.position_token('bench')
+
+        sent_legacy, t_legacy, m_legacy = measure(legacy, path, listeners)
+        sent_range, t_range, m_range = measure(ranged, port, quote(name), size, listeners, token)
+        server.shutdown()
+
+    print(f"{listeners} 个听众，单个 MP3 {megabytes:.0f} MB")
+    print(f"{'方式':<20}{'传输(MB)':>10}{'耗时(s)':>10}{'峰值内存(MB)':>16}")
+    for label, sent, t, m in [('整文件读入', sent_legacy, t_legacy, m_legacy),
+                              ('Range 分块流', sent_range, t_range, m_range)]:
+        print(f"{label:<20}{sent / 1024 / 1024:>10.1f}{t:>10.2f}{m / 1024 / 1024:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
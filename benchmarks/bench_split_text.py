@@ -0,0 +1,101 @@
+"""分段器基准：旧版 split_text（整本 findall + 字符串拼接）vs 流式 iter_chunks
+
+用法：python benchmarks/bench_split_text.py [语料MB数]
+"""
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_split import iter_file_chunks, split_text  # noqa: E402
+
+
+def legacy_split_text(text: str, max_bytes: int = 1800) -> list[str]:
+    """改造前的实现，原样保留作对照"""
+    text = text.lstrip('\ufeff').strip()
+    if not text:
+        return []
+    sentences = re.findall(r'[^。！？\.\?\!]*[。！？\.\?\!]?', text, flags=re.S)
+    sentences = [s.strip() for s in sentences if s.strip()]
+    sentences = [s for s in sentences if re.search(r'[\u4e00-\u9fa5a-zA-Z0-9]', s)]
+    if not sentences:
+        return [text] if len(text.encode('utf-8')) <= max_bytes else []
+    chunks, buf, buf_len = [], '', 0
+    for sent in sentences:
+        l = len(sent.encode('utf-8'))
+        if buf_len + l <= max_bytes:
+            buf, buf_len = buf + sent, buf_len + l
+        else:
+            if buf:
+                chunks.append(buf)
+            buf, buf_len = sent, l
+    if buf:
+        chunks.append(buf)
+    return chunks
+
+
+def make_corpus(path: str, megabytes: float, seed: int = 0):
+    """用 Books 中的样本文字随机拼出指定大小的语料"""
+    rng = random.Random(seed)
+    books_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Books')
+    sample = ''
+    for name in sorted(os.listdir(books_dir)):
+        with open(os.path.join(books_dir, name), 'r', encoding='utf-8') as f:
+            sample += f.read().lstrip('\ufeff')
+    sentences = [s for s in re.split(r'(?<=[。！？])', sample) if s.strip()]
+    target = int(megabytes * 1024 * 1024)
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while written < target:
+            para = ''.join(rng.choice(sentences) for _ in range(rng.randint(3, 12))) + '\n'
+            f.write(para)
+            written += len(para.encode('utf-8'))
+
+
+def measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def first_chunk_latency(path: str) -> float:
+    t0 = time.perf_counter()
+    next(iter_file_chunks(path, max_bytes=1400))
+    return time.perf_counter() - t0
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'corpus.txt')
+        make_corpus(path, megabytes)
+
+        def read_all():
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+
+        legacy, t_legacy, m_legacy = measure(lambda: legacy_split_text(read_all(), 1400))
+        current, t_list, m_list = measure(lambda: split_text(read_all(), 1400))
+        _, t_stream, m_stream = measure(lambda: sum(1 for _ in iter_file_chunks(path, 1400)))
+        assert legacy == current == list(iter_file_chunks(path, 1400)), "分段结果与旧实现不一致"
+
+        print(f"语料 {megabytes:.0f} MB，{len(legacy)} 段（结果与旧实现一致）")
+        print(f"{'实现':<28}{'耗时(s)':>10}{'峰值内存(MB)':>16}")
+        for name, t, m in [('legacy split_text', t_legacy, m_legacy),
+                           ('split_text (iter_chunks)', t_list, m_list),
+                           ('iter_file_chunks 流式', t_stream, m_stream)]:
+            print(f"{name:<28}{t:>10.2f}{m / 1024 / 1024:>16.1f}")
+        print(f"流式首段延迟：{first_chunk_latency(path) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""冷启动对比：app.py 顶层导入 pandas / 百度 SDK（旧） vs 按功能延迟导入（新）
+
+每次测量都在新的 Python 进程中进行（模块缓存为空，与容器冷启动一致）：
+- import：Streamlit 已加载的前提下导入 app 的耗时（服务进程里 streamlit 早已导入）
+- login：用 AppTest 渲染未登录时的首屏（登录页），含脚本执行
+
+eager 在导入 app 之前先导入 pandas 与 aip，模拟旧版的顶层导入。
+
+用法：python benchmarks/bench_startup.py [重复次数]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_EAGER = """
+import pandas
+try:
+    import aip
+except ImportError:
+    pass
+"""
+
+_IMPORT = """
+import json, sys, time
+import streamlit
+t0 = time.perf_counter()
+{eager}
+import app
+print(json.dumps({{'seconds': time.perf_counter() - t0,
+                   'pandas': 'pandas' in sys.modules, 'aip': 'aip' in sys.modules}}))
+"""
+
+_LOGIN = """
+import json, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+source = {eager!r} + open('app.py', encoding='utf-8').read()
+at = AppTest.from_string(source, default_timeout=60).run()
+assert not at.exception, at.exception
+print(json.dumps({{'seconds': time.perf_counter() - t0,
+                   'pandas': 'pandas' in sys.modules, 'aip': 'aip' in sys.modules}}))
+"""
+
+
+def run(template: str, eager: bool) -> dict:
+    code = template.format(eager=_EAGER if eager else '')
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True,
+                         text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'场景':<8}{'方式':<8}{'中位数':>10}{'最小':>10}  已加载")
+    for name, template in (('import', _IMPORT), ('login', _LOGIN)):
+        for eager in (True, False):
+            results = [run(template, eager) for _ in range(repeat)]
+            seconds = [r['seconds'] * 1000 for r in results]
+            loaded = [m for m in ('pandas', 'aip') if results[-1][m]]
+            print(f"{name:<8}{'eager' if eager else 'lazy':<8}"
+                  f"{statistics.median(seconds):>8.0f}ms{min(seconds):>8.0f}ms  {', '.join(loaded) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""离线基准套件：不需要网络与百度凭证，合成走 tts_backends.FakeTTS
+
+覆盖四个场景，每个场景分别在 10 / 1k / 100k 规模下测量：
+- split：split_text 分段（N 句文本）
+- synthesis：synthesize_book 整本合成 N 段（模拟延迟 / 错误率可调），以及全部已完成时的续传扫描
+- playback：N 条播放记录下的单条 upsert、批量位置存档与读取
+- library：N 个音频文件的音频库扫描、目录未变时的刷新与按文件名定位
+
+每个 (场景, 规模) 在独立进程、独立临时目录中运行，互不影响；
+结果以 JSON 输出（--out 写文件，否则打印到标准输出），同时在标准错误打印摘要表。
+
+用法：python benchmarks/bench_suite.py [--scales 10,1000,100000] [--cases split,synthesis]
+                                       [--latency 0.0] [--error-rate 0.0] [--out results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CASES = ('split', 'synthesis', 'playback', 'library')
+_SENTENCES = ['今天天气很好。', '我们一起去公园散步吧！', '你知道这本书讲的是什么吗？',
+              '他说：“明天见。”', '风吹过田野，麦浪一层一层地涌向远方。']
+
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def bench_split(n: int, args) -> dict:
+    from synthesis import chunk_kwargs
+    from text_split import split_text
+    rnd = random.Random(n)
+    text = ''.join(rnd.choice(_SENTENCES) for _ in range(n))
+    chunks, seconds = _timed(split_text, text, **chunk_kwargs())
+    return {'seconds': seconds, 'chunks': len(chunks), 'chars': len(text),
+            'chars_per_sec': len(text) / seconds if seconds else None}
+
+
+def bench_synthesis(n: int, args) -> dict:
+    import config
+    from synthesis import synthesize_book
+    from tts_backends import FakeTTS
+    config.ensure_dirs()
+    # 模拟错误时不要真的退避数秒
+    config.TTS_BACKOFF_BASE = 0.001
+    config.TTS_BACKOFF_MAX = 0.01
+    rnd = random.Random(n)
+    chunks = [rnd.choice(_SENTENCES) * 4 for _ in range(n)]
+    client = FakeTTS(latency=args.latency, error_rate=args.error_rate, frames_per_char=1, seed=n)
+    (files, error), seconds = _timed(synthesize_book, chunks, 0, 'bench', '女声', client=client)
+    # 第二遍：清单显示全部已完成，只做续传检查
+    (_, resume_error), resume_seconds = _timed(synthesize_book, chunks, 0, 'bench', '女声', client=client)
+    return {'seconds': seconds, 'segments': len(files), 'error': error or resume_error,
+            'segments_per_sec': len(files) / seconds if seconds else None,
+            'api_calls': client.calls, 'api_errors': client.errors,
+            'resume_seconds': resume_seconds, 'workers': config.TTS_WORKERS, 'latency': args.latency}
+
+
+def bench_playback(n: int, args) -> dict:
+    import playback_store
+    names = [f'book{i // 100}_女声_seg{i % 100 + 1:03d}.mp3' for i in range(n)]
+    _, seed_seconds = _timed(playback_store.update_positions, [('bench', f, 1.0, False) for f in names])
+    rnd = random.Random(n)
+    latencies = []
+    for _ in range(min(n, 1000)):
+        _, seconds = _timed(playback_store.update_record, 'bench', rnd.choice(names), rnd.random() * 60)
+        latencies.append(seconds)
+    batch = [('bench', rnd.choice(names), rnd.random() * 60, False) for _ in range(min(n, 1000))]
+    _, batch_seconds = _timed(playback_store.update_positions, batch)
+    records, read_seconds = _timed(playback_store.get_records, 'bench')
+    _, one_seconds = _timed(playback_store.get_record, 'bench', names[-1])
+    return {'seconds': seed_seconds, 'records': len(records),
+            'update_p50_ms': statistics.median(latencies) * 1000,
+            'update_p95_ms': sorted(latencies)[int(len(latencies) * 0.95)] * 1000,
+            'batch_1k_seconds': batch_seconds, 'get_records_seconds': read_seconds,
+            'get_record_ms': one_seconds * 1000}
+
+
+def bench_library(n: int, args) -> dict:
+    import config
+    from library_index import LibraryIndex
+    config.ensure_dirs()
+    for i in range(n):
+        open(os.path.join(config.AUDIO_FILES_DIR, f'book{i // 100}_女声_seg{i % 100 + 1:03d}.mp3'), 'wb').close()
+    library = LibraryIndex()
+    _, cold_seconds = _timed(library.refresh)
+    _, warm_seconds = _timed(library.refresh)
+    names = library.files()
+    rnd = random.Random(n)
+    probes = [rnd.choice(names) for _ in range(1000)]
+    t0 = time.perf_counter()
+    for name in probes:
+        library.neighbor(name, 1)
+        library.group_index(name)
+        library.next_in_group(name)
+    lookup_seconds = time.perf_counter() - t0
+    return {'seconds': cold_seconds, 'files': len(library), 'groups': len(library.groups),
+            'warm_refresh_ms': warm_seconds * 1000, 'lookup_us': lookup_seconds / len(probes) * 1e6}
+
+
+def run_case(case: str, n: int, args) -> dict:
+    """子进程入口：在临时目录中运行一个 (场景, 规模)"""
+    with tempfile.TemporaryDirectory(prefix='qradio-bench-') as workdir:
+        os.chdir(workdir)
+        result = globals()[f'bench_{case}'](n, args)
+        os.chdir(ROOT)
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='10,1000,100000')
+    parser.add_argument('--cases', default=','.join(CASES))
+    parser.add_argument('--latency', type=float, default=0.0, help='FakeTTS 每次请求的模拟延迟（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='FakeTTS 返回错误字典的概率')
+    parser.add_argument('--out', help='结果 JSON 的输出路径（默认打印到标准输出）')
+    parser.add_argument('--run', nargs=2, metavar=('CASE', 'N'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_case(args.run[0], int(args.run[1]), args)))
+        return
+
+    results = []
+    for case in args.cases.split(','):
+        if case not in CASES:
+            parser.error(f"未知场景：{case}")
+        for n in map(int, args.scales.split(',')):
+            cmd = [sys.executable, os.path.abspath(__file__), '--run', case, str(n),
+                   '--latency', str(args.latency), '--error-rate', str(args.error_rate)]
+            out = subprocess.run(cmd, capture_output=True, text=True)
+            if out.returncode != 0:
+                result = {'error': out.stderr.strip().splitlines()[-1] if out.stderr.strip() else 'failed'}
+            else:
+                result = json.loads(out.stdout.strip().splitlines()[-1])
+            results.append({'case': case, 'scale': n, **result})
+            print(f"{case:<10}{n:>8}  {result.get('seconds', float('nan')):>9.3f}s  "
+                  f"{result.get('peak_rss_mb', 0):>7.1f} MB  {result.get('error') or ''}", file=sys.stderr)
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': {'latency': args.latency, 'error_rate': args.error_rate},
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
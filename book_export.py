@@ -0,0 +1,151 @@
+"""整本导出：把 (书, 音色) 的全部分段、清单、CUE 与播放记录打包成 ZIP，边生成边发送
+
+ZIP 条目一律为 stored（MP3 已是压缩数据，再压缩几乎没有收益），CRC32 在读文件时顺带计算，
+写在每个条目之后的数据描述符里（通用标志位 3），因此不必先读一遍文件，也不必缓冲整个压缩包：
+内存占用只有一个读块与中央目录（每个条目几十字节），第一个字节在读第一个文件之前就能发出。
+超过 4 GB 的条目 / 偏移自动使用 ZIP64 扩展。
+"""
+import csv
+import io
+import json
+import os
+import struct
+import time
+import zlib
+from datetime import datetime
+
+import playback_store
+from library_index import LibraryIndex, load_media_info
+from synthesis import JobManifest
+
+READ_SIZE = 64 * 1024
+
+# 达到 _ZIP64_LIMIT 的大小 / 偏移改写在 ZIP64 扩展字段中，原字段填 _ZIP64_MARKER
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_MARKER = 0xFFFFFFFF
+_FLAGS = 0x0008 | 0x0800  # 数据描述符 | 文件名为 UTF-8
+# 创建系统记为 Unix：解压工具按 UTF-8 而不是 DOS 代码页处理文件名，并使用 0644 权限
+_MADE_BY = (3 << 8) | 45
+_EXTERNAL_ATTR = 0o100644 << 16
+
+
+def _dos_time(ts: float) -> tuple[int, int]:
+    t = time.localtime(ts)
+    year = max(t.tm_year, 1980)
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), \
+        ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def _open_source(source):
+    """source 为文件路径或 bytes，返回 (可读对象, 大小, 修改时间)"""
+    if isinstance(source, bytes):
+        return io.BytesIO(source), len(source), time.time()
+    f = open(source, 'rb')
+    stat = os.fstat(f.fileno())
+    return f, stat.st_size, stat.st_mtime
+
+
+def iter_zip(entries, read_size: int = READ_SIZE):
+    """entries：[(压缩包内路径, 文件路径或 bytes)]，可以是生成器；逐块产出 ZIP 数据"""
+    offset = 0
+    central = []
+    for arcname, source in entries:
+        name = arcname.encode('utf-8')
+        f, size, mtime = _open_source(source)
+        with f:
+            dos_time, dos_date = _dos_time(mtime)
+            zip64 = size >= _ZIP64_LIMIT
+            extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0) if zip64 else b''
+            header = struct.pack('<IHHHHHIIIHH', 0x04034b50, 45 if zip64 else 20, _FLAGS, 0,
+                                 dos_time, dos_date, 0,
+                                 _ZIP64_MARKER if zip64 else 0, _ZIP64_MARKER if zip64 else 0,
+                                 len(name), len(extra)) + name + extra
+            yield header
+            # 只读登记时的大小：文件被替换或追加时，压缩包内容仍与目录记录一致
+            crc, written = 0, 0
+            while written < size:
+                block = f.read(min(read_size, size - written))
+                if not block:
+                    break
+                crc = zlib.crc32(block, crc)
+                written += len(block)
+                yield block
+        if zip64:
+            descriptor = struct.pack('<IIQQ', 0x08074b50, crc, written, written)
+        else:
+            descriptor = struct.pack('<IIII', 0x08074b50, crc, written, written)
+        yield descriptor
+        central.append((name, crc, written, offset, dos_time, dos_date, zip64))
+        offset += len(header) + written + len(descriptor)
+
+    cd_offset = offset
+    cd_size = 0
+    def field(value: int) -> int:
+        return value if value < _ZIP64_LIMIT else _ZIP64_MARKER
+
+    for name, crc, size, entry_offset, dos_time, dos_date, zip64 in central:
+        fields = [v for v in (size, size, entry_offset) if v >= _ZIP64_LIMIT]
+        extra = struct.pack(f'<HH{len(fields)}Q', 0x0001, 8 * len(fields), *fields) if fields else b''
+        record = struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50, _MADE_BY, 45 if zip64 or fields else 20, _FLAGS, 0,
+            dos_time, dos_date, crc,
+            field(size), field(size), len(name), len(extra), 0, 0, 0, _EXTERNAL_ATTR, field(entry_offset),
+        ) + name + extra
+        cd_size += len(record)
+        yield record
+
+    count = len(central)
+    if count >= 0xFFFF or cd_size >= _ZIP64_LIMIT or cd_offset >= _ZIP64_LIMIT:
+        zip64_end = cd_offset + cd_size
+        yield struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, _MADE_BY, 45, 0, 0, count, count, cd_size, cd_offset)
+        yield struct.pack('<IIQI', 0x07064b50, 0, zip64_end, 1)
+    yield struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                      field(cd_size), field(cd_offset), 0)
+
+
+def _cue_sheet(book: str, voice: str, files: list[str]) -> str:
+    """每个分段一个 FILE / TRACK（CUE 规范最多 99 轨，更长的书部分播放器只识别前 99 段）"""
+    lines = [f'TITLE "{book}"', f'PERFORMER "{voice}"']
+    for i, name in enumerate(files, 1):
+        lines += [f'FILE "{name}" MP3', f'  TRACK {i:02d} AUDIO', f'    TITLE "第 {i} 段"',
+                  '    INDEX 01 00:00:00']
+    return '\n'.join(lines) + '\n'
+
+
+def _records_csv(username: str, files: list[str]) -> str:
+    records = playback_store.get_records(username)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['文件名', '播放次数', '最后播放', '保存位置', '时长', '已完成'])
+    for name in files:
+        rec = records.get(name)
+        if rec:
+            writer.writerow([name, rec['play_count'], rec['last_played'] or '', rec['last_position'],
+                             rec['duration'], int(rec['completed'])])
+    return out.getvalue()
+
+
+def book_entries(username: str, book: str, voice: str, library: LibraryIndex = None) -> list:
+    """导出的条目：分段 MP3、manifest.json、CUE 与当前用户的播放记录；没有分段时返回空列表"""
+    library = library or LibraryIndex().refresh()
+    group = library.groups.get((book, voice), []) if voice else []
+    files = [e.name for e in group]
+    if not files:
+        return []
+    folder = f"{book}_{voice}"
+    chars = {v.get('file'): v.get('chars') for v in JobManifest(book, voice).data.get('segments', {}).values()}
+    # 时长取合成时登记在媒体信息库中的值，不为导出再扫描帧头（未登记的分段记为 null）
+    media_info = load_media_info()
+    start, segments = 0.0, []
+    for entry in group:
+        duration = media_info.get(entry.name, {}).get('duration')
+        segments.append({'segment': entry.segment, 'file': entry.name, 'start': round(start, 3),
+                         'duration': duration, 'chars': chars.get(entry.name)})
+        start += duration or 0.0
+    manifest = {'book': book, 'voice': voice, 'exported_at': datetime.now().isoformat(),
+                'duration': round(start, 3), 'segments': segments}
+    entries = [(f"{folder}/manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')),
+               (f"{folder}/{folder}.cue", _cue_sheet(book, voice, files).encode('utf-8')),
+               (f"{folder}/playback_records.csv", _records_csv(username, files).encode('utf-8-sig'))]
+    entries += [(f"{folder}/{name}", os.path.join(library.audio_dir, name)) for name in files]
+    return entries
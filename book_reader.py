@@ -0,0 +1,94 @@
+import codecs
+import os
+import threading
+
+import chardet
+
+import config
+from text_split import iter_chunks
+
+# 探测编码只读开头这么多字节
+SAMPLE_BYTES = 64 * 1024
+READ_SIZE = 64 * 1024
+
+# chardet 常把中文文本识别成 GB2312 / GBK，统一用其超集 GB18030 解码
+_ENCODING_ALIASES = {'gb2312': 'gb18030', 'gbk': 'gb18030', 'ascii': 'utf-8'}
+
+_meta_cache = {}
+_meta_lock = threading.Lock()
+
+
+def book_path(filename: str) -> str:
+    return os.path.join(config.BOOKS_DIR, filename)
+
+
+def detect_encoding(path: str) -> str:
+    """根据文件开头的样本判断编码：BOM → UTF-8 试解码 → chardet"""
+    with open(path, 'rb') as f:
+        sample = f.read(SAMPLE_BYTES)
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        # 增量解码：样本末尾被截断的多字节字符不算错误
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    guess = (chardet.detect(sample).get('encoding') or 'gb18030').lower()
+    return _ENCODING_ALIASES.get(guess, guess)
+
+
+def _metadata(path: str) -> dict:
+    """按 (mtime, size) 缓存的编码与大小；文件变化后自动失效"""
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _meta_lock:
+        meta = _meta_cache.get(path)
+        if meta and meta['stamp'] == stamp:
+            return meta
+    meta = {'stamp': stamp, 'encoding': detect_encoding(path), 'size': stat.st_size, 'chars': None}
+    with _meta_lock:
+        _meta_cache[path] = meta
+    return meta
+
+
+def get_book_info(filename: str, count_chars: bool = False) -> dict:
+    """书的编码 / 字节数 / 字符数；字符数需要流式扫描全文，只在首次需要时计算"""
+    path = book_path(filename)
+    meta = _metadata(path)
+    if count_chars and meta['chars'] is None:
+        chars = 0
+        with open_book(filename) as f:
+            while True:
+                block = f.read(READ_SIZE)
+                if not block:
+                    break
+                chars += len(block)
+        meta['chars'] = chars
+    return {k: meta[k] for k in ('encoding', 'size', 'chars')}
+
+
+def open_book(filename: str):
+    """以探测到的编码打开书，返回可流式读取的文本流（无法解码的字节用 U+FFFD 代替）"""
+    encoding = _metadata(book_path(filename))['encoding']
+    return open(book_path(filename), 'r', encoding=encoding, errors='replace')
+
+
+def read_preview(filename: str, chars: int = 500) -> str:
+    """只读取开头 chars 个字符（通常不过几 KB）用于预览"""
+    with open_book(filename) as f:
+        text = f.read(chars + 1).lstrip('\ufeff')
+    return text[:chars] + "..." if len(text) > chars else text
+
+
+def read_book(filename: str) -> str:
+    with open_book(filename) as f:
+        return f.read()
+
+
+def iter_book_chunks(filename: str, **kwargs):
+    """流式分段，参数透传给 text_split.iter_chunks"""
+    with open_book(filename) as f:
+        yield from iter_chunks(f, **kwargs)
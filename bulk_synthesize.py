@@ -0,0 +1,134 @@
+"""批量合成：不打开浏览器，把 Books 目录中的书按所有音色一次合成完（适合夜间预生成）
+
+用法：
+    python bulk_synthesize.py                      # Books/*.txt × 全部音色
+    python bulk_synthesize.py "三国*.txt" --voices 女声,度逍遥 --processes 4
+    python bulk_synthesize.py --dry-run            # 只统计分段数 / 字节数 / 请求量，不调用接口
+
+每个 (书, 音色) 在进程池中独立合成，沿用 synthesize_book 的缓存、重试与断点续传；
+进程间按进程数平分每个账号的 QPS，总请求速率不会超过账号上限。
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import chapters
+import config
+from book_reader import iter_book_chunks
+from synthesis import chunk_kwargs, synthesize_book
+from text_split import pack_report
+from tts_backends import make_client
+from tts_cache import TTSCache
+
+# 进程池中每个进程各自的合成客户端与缓存
+_client = None
+_cache = None
+
+
+def find_books(patterns) -> list[str]:
+    """按通配符（相对 BOOKS_DIR）查找书，返回相对 BOOKS_DIR 的文件名"""
+    books = set()
+    for pattern in patterns or ['*.txt']:
+        for path in glob.glob(os.path.join(config.BOOKS_DIR, pattern)):
+            if os.path.isfile(path) and path.endswith('.txt'):
+                books.add(os.path.relpath(path, config.BOOKS_DIR))
+    return sorted(books)
+
+
+def plan_book(book_file: str) -> dict:
+    """试运行：只分段、不合成"""
+    stats = {}
+    segments = sum(1 for _ in iter_book_chunks(book_file, stats=stats, **chunk_kwargs()))
+    return {'segments': segments, 'bytes': stats.get('bytes', 0), 'report': pack_report(stats, config.TTS_MAX_BYTES)}
+
+
+def _init_process(processes: int):
+    global _client, _cache
+    # 各进程平分账号 QPS
+    config.TTS_CREDENTIALS = [
+        {**c, 'qps': c.get('qps', config.TTS_DEFAULT_QPS) / processes} for c in config.TTS_CREDENTIALS
+    ]
+    config.TTS_DEFAULT_QPS = config.TTS_DEFAULT_QPS / processes
+    _client = make_client()
+    _cache = TTSCache()
+
+
+def synthesize_one(book_file: str, voice_name: str, assemble: bool) -> dict:
+    base_name = os.path.splitext(book_file)[0]
+    t0 = time.perf_counter()
+    chunks = iter_book_chunks(book_file, **chunk_kwargs())
+    files, error = synthesize_book(chunks, config.VOICE_OPTIONS[voice_name], base_name, voice_name,
+                                   client=_client, cache=_cache)
+    if not error and not files:
+        error = "拆分后没有有效段落！"
+    if not error and assemble:
+        try:
+            chapters.assemble_chapter(base_name, voice_name, files)
+        except (ValueError, OSError) as e:
+            error = f"拼接整章失败：{e}"
+    return {'segments': len(files), 'error': error, 'seconds': time.perf_counter() - t0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量合成 Books 目录中的书")
+    parser.add_argument('patterns', nargs='*', help=f"相对 {config.BOOKS_DIR} 的通配符，默认 *.txt")
+    parser.add_argument('--voices', help=f"逗号分隔的音色，默认全部：{','.join(config.VOICE_OPTIONS)}")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help="并行的合成进程数")
+    parser.add_argument('--dry-run', action='store_true', help="只统计分段与请求量，不调用接口")
+    parser.add_argument('--assemble', action='store_true', default=config.CHAPTER_ASSEMBLY,
+                        help="合成完成后拼接整章")
+    args = parser.parse_args()
+
+    config.ensure_dirs()
+    voices = args.voices.split(',') if args.voices else list(config.VOICE_OPTIONS)
+    unknown = [v for v in voices if v not in config.VOICE_OPTIONS]
+    if unknown:
+        parser.error(f"未知音色：{','.join(unknown)}")
+    books = find_books(args.patterns)
+    if not books:
+        print(f"{config.BOOKS_DIR} 中没有匹配的 txt 文件")
+        return 1
+
+    if args.dry_run:
+        total_segments = total_bytes = 0
+        for book_file in books:
+            plan = plan_book(book_file)
+            total_segments += plan['segments']
+            total_bytes += plan['bytes']
+            print(f"{book_file}：{plan['segments']} 段，{plan['bytes'] / 1024:.1f} KB，"
+                  f"平均填充率 {plan['report']['fill_ratio']:.0%}")
+        requests = total_segments * len(voices)
+        qps = sum(c.get('qps', config.TTS_DEFAULT_QPS) for c in config.TTS_CREDENTIALS) \
+            if config.TTS_CREDENTIALS else config.TTS_DEFAULT_QPS
+        print(f"共 {len(books)} 本书 × {len(voices)} 个音色：{total_segments} 段 / 音色，"
+              f"{total_bytes / 1024 / 1024:.2f} MB 文本，约 {requests} 次请求"
+              f"（按 {qps:g} QPS 至少需要 {requests / qps / 60:.1f} 分钟，未扣除缓存命中与已完成的分段）")
+        return 0
+
+    tasks = [(book_file, voice) for book_file in books for voice in voices]
+    processes = max(1, min(args.processes, len(tasks)))
+    print(f"开始合成：{len(books)} 本书 × {len(voices)} 个音色，{processes} 个进程")
+    failed = 0
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_process,
+                             initargs=(processes,)) as pool:
+        futures = {pool.submit(synthesize_one, book_file, voice, args.assemble): (book_file, voice)
+                   for book_file, voice in tasks}
+        for done, fut in enumerate(as_completed(futures), 1):
+            book_file, voice = futures[fut]
+            try:
+                result = fut.result()
+            except Exception as e:
+                result = {'segments': 0, 'error': f"任务异常：{e}", 'seconds': 0}
+            failed += bool(result['error'])
+            status = f"失败：{result['error']}" if result['error'] else \
+                f"{result['segments']} 段，用时 {result['seconds']:.1f} 秒"
+            print(f"[{done}/{len(tasks)}] {book_file} / {voice}：{status}")
+    print(f"完成：成功 {len(tasks) - failed}，失败 {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
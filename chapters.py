@@ -0,0 +1,193 @@
+"""整章拼接：把同一 (书, 音色) 的分段按帧首尾相接成一个 MP3，不重新编码
+
+MP3 帧彼此独立，去掉每段的 ID3 标签与 Xing/Info 信息帧后直接拼接即可得到
+合法的音频流。拼接时同时写出 seek 索引（JSON）：每段在整章中的
+字符偏移、字节偏移与时间偏移，按文本位置或播放时间定位都是二分查找。
+"""
+import json
+import os
+from bisect import bisect_right
+
+import config
+import mp3_scan
+from library_index import LibraryIndex, parse_audio_name
+from synthesis import JobManifest
+
+
+def chapter_name(book: str, voice: str) -> str:
+    return f"{book}_{voice}.mp3"
+
+
+def chapter_file(book: str, voice: str) -> str:
+    """整章文件相对 AUDIO_FILES_DIR 的路径，旁路服务与播放记录都用它作文件名"""
+    folder = os.path.relpath(config.CHAPTERS_DIR, config.AUDIO_FILES_DIR)
+    return f"{folder}/{chapter_name(book, voice)}"
+
+
+def _paths(book: str, voice: str, chapters_dir: str = None):
+    chapters_dir = chapters_dir or config.CHAPTERS_DIR
+    mp3_path = os.path.join(chapters_dir, chapter_name(book, voice))
+    return mp3_path, os.path.splitext(mp3_path)[0] + '.index.json'
+
+
+def _stamp(path: str):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class SeekIndex:
+    """整章的 seek 索引：分段 ↔ 字符偏移 ↔ 字节偏移 ↔ 时间偏移"""
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.segments = data['segments']
+        self._times = [s['time_offset'] for s in self.segments]
+        self._chars = [s['char_offset'] for s in self.segments]
+        self._numbers = {s['segment']: i for i, s in enumerate(self.segments)}
+
+    @property
+    def duration(self) -> float:
+        return self.data['duration']
+
+    def _at(self, offsets: list, value: float) -> dict:
+        return self.segments[max(0, bisect_right(offsets, value) - 1)]
+
+    def segment_at_time(self, seconds: float) -> dict:
+        """整章播放到 seconds 时正在播放的分段"""
+        return self._at(self._times, seconds)
+
+    def segment_at_char(self, char_offset: int) -> dict:
+        return self._at(self._chars, char_offset)
+
+    def time_of_segment(self, segment: int) -> float:
+        """分段号在整章中的起始时间，不在本章时返回 0"""
+        i = self._numbers.get(segment)
+        return self.segments[i]['time_offset'] if i is not None else 0.0
+
+    def segment_range(self, segment: int) -> list:
+        """分段号在整章中的 [起始, 结束) 时间"""
+        start = self.time_of_segment(segment)
+        i = self._numbers.get(segment)
+        return [start, start + self.segments[i]['duration'] if i is not None else start]
+
+    def time_for_char(self, char_offset: int) -> float:
+        """全书第 char_offset 个字大约在整章的哪一秒（段内按字数线性估计）"""
+        seg = self.segment_at_char(char_offset)
+        within = min(max(char_offset - seg['char_offset'], 0), seg['chars'])
+        ratio = within / seg['chars'] if seg['chars'] else 0
+        return seg['time_offset'] + seg['duration'] * ratio
+
+    def char_for_time(self, seconds: float) -> int:
+        seg = self.segment_at_time(seconds)
+        within = min(max(seconds - seg['time_offset'], 0), seg['duration'])
+        ratio = within / seg['duration'] if seg['duration'] else 0
+        return seg['char_offset'] + round(seg['chars'] * ratio)
+
+    def byte_for_time(self, seconds: float) -> int:
+        """seconds 处对应的字节偏移（段内按时长线性估计，百度输出为 CBR，误差在一帧以内）"""
+        seg = self.segment_at_time(seconds)
+        within = min(max(seconds - seg['time_offset'], 0), seg['duration'])
+        ratio = within / seg['duration'] if seg['duration'] else 0
+        return seg['byte_offset'] + int(seg['bytes'] * ratio)
+
+
+def assemble_chapter(book: str, voice: str, segment_files: list = None,
+                     audio_dir: str = None, chapters_dir: str = None) -> SeekIndex:
+    """
+    按分段号顺序拼接 (书, 音色) 的全部分段，写出整章 MP3 与 seek 索引
+    segment_files 为空时从音频库中取该分组；任一分段损坏或采样率不一致时抛出 ValueError
+    """
+    audio_dir = audio_dir or config.AUDIO_FILES_DIR
+    if segment_files is None:
+        group = LibraryIndex(audio_dir).refresh().groups.get((book, voice), [])
+        segment_files = [e.name for e in group]
+    if not segment_files:
+        raise ValueError(f"没有找到 {book} / {voice} 的分段")
+    # 合成清单记录了每段的字数，用来把文本位置换算到整章
+    manifest = JobManifest(book, voice).data.get('segments', {})
+    by_file = {v.get('file'): v for v in manifest.values()}
+
+    mp3_path, index_path = _paths(book, voice, chapters_dir)
+    os.makedirs(os.path.dirname(mp3_path), exist_ok=True)
+    segments, sources = [], {}
+    byte_offset, time_offset, char_offset, sample_rate = 0, 0.0, 0, 0
+    tmp_path = mp3_path + '.part'
+    try:
+        with open(tmp_path, 'wb') as out:
+            for name in segment_files:
+                path = os.path.join(audio_dir, name)
+                with open(path, 'rb') as f:
+                    data = f.read()
+                info = mp3_scan.scan_bytes(data)
+                if not info['valid']:
+                    raise ValueError(f"{name} 已损坏：{info['error']}")
+                if sample_rate and info['sample_rate'] != sample_rate:
+                    raise ValueError(f"{name} 的采样率 {info['sample_rate']} 与前面分段不一致")
+                sample_rate = info['sample_rate']
+
+                start, end = info['audio_offset'], info['audio_end']
+                duration = info['duration']
+                skip = mp3_scan.info_frame_length(data, start)
+                if skip:
+                    header = mp3_scan.parse_frame_header(data[start], data[start + 1], data[start + 2])
+                    duration -= header[1] / header[2]
+                    start += skip
+                out.write(data[start:end])
+
+                chars = by_file.get(name, {}).get('chars', 0)
+                segments.append({
+                    # 分段号沿用文件名中的编号，与播放器里“第 N 段”一致
+                    'segment': parse_audio_name(name).segment or len(segments) + 1,
+                    'file': name,
+                    'char_offset': char_offset,
+                    'chars': chars,
+                    'byte_offset': byte_offset,
+                    'bytes': end - start,
+                    'time_offset': round(time_offset, 4),
+                    'duration': round(duration, 4),
+                })
+                sources[name] = _stamp(path)
+                byte_offset += end - start
+                time_offset += duration
+                char_offset += chars
+        os.replace(tmp_path, mp3_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    data = {
+        'book': book,
+        'voice': voice,
+        'file': chapter_file(book, voice),
+        'bytes': byte_offset,
+        'duration': round(time_offset, 4),
+        'chars': char_offset,
+        'sample_rate': sample_rate,
+        'sources': sources,
+        'segments': segments,
+    }
+    tmp_path = index_path + '.part'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, index_path)
+    return SeekIndex(data)
+
+
+def load_chapter(book: str, voice: str, segment_files: list = None,
+                 audio_dir: str = None, chapters_dir: str = None):
+    """读取整章的 seek 索引；未拼接，或分段在拼接后有增删改时返回 None"""
+    audio_dir = audio_dir or config.AUDIO_FILES_DIR
+    mp3_path, index_path = _paths(book, voice, chapters_dir)
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not os.path.exists(mp3_path) or os.path.getsize(mp3_path) != data['bytes']:
+            return None
+        if segment_files is not None and sorted(segment_files) != sorted(data['sources']):
+            return None
+        for name, stamp in data['sources'].items():
+            if _stamp(os.path.join(audio_dir, name)) != stamp:
+                return None
+    except (OSError, ValueError, KeyError):
+        return None
+    return SeekIndex(data)
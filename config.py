@@ -6,10 +6,102 @@ APP_ID = '121665854'
 API_KEY = '5t4CiGdr9aV5EmrcQT8RnR4L'
 SECRET_KEY = 'BFhvJKqp7Pz8MDAiXzIYiLmdDcfedTYo'
 
+# 多账号凭证池：每项 {'app_id', 'api_key', 'secret_key', 'qps'}，为空时只用上面这一组；
+# 请求分配给余量最多的凭证，总吞吐随账号数增加（TTS_WORKERS 需不小于 总 QPS × 单次耗时）
+TTS_CREDENTIALS = []
+# 每个账号的默认 QPS 上限（百度免费额度通常为 2~10）
+TTS_DEFAULT_QPS = 5
+# 限流时的自适应调速（AIMD）：每次成功加 INCREASE，被限流乘以 DECREASE
+TTS_AIMD_INCREASE = 0.1
+TTS_AIMD_DECREASE = 0.5
+# 日配额用完的凭证暂停多久再试（秒）
+TTS_QUOTA_COOLDOWN = 3600
+
 # 文件夹路径
 BOOKS_DIR = 'Books'
 AUDIO_FILES_DIR = 'Audio_files'
-PLAYBACK_RECORDS_FILE = 'playback_records.json'
+PLAYBACK_RECORDS_FILE = 'playback_records.json'  # 旧版记录，首次启动时迁移进 PLAYBACK_DB
+PLAYBACK_DB = 'playback_records.db'
+# 音频媒体信息（时长 / 完整性），合成时写入
+LIBRARY_DB = 'library.db'
+
+# 全文搜索：Books 的字符 n-gram 倒排索引
+SEARCH_DB = 'search_index.db'
+SEARCH_NGRAM = 2
+SEARCH_MAX_RESULTS = 50
+
+# 百度 TTS 单次请求的文本上限：tex 须小于 1024 字节（按 GBK 计长）
+TTS_MAX_BYTES = 1023
+TTS_BYTE_ENCODING = 'gbk'
+# 尽量填满每次请求：超长句按 ，；、 或字符拆开；False 时只按整句分段
+TTS_PACK_CHUNKS = True
+# 旧的分段方式（整句、UTF-8 1400 字节），仅用于统计节省的请求数
+TTS_BASELINE_BYTES = 1400
+
+# 合成后端：baidu 为百度在线 TTS；fake 为本地模拟（离线压测 / 开发调试，见 tts_backends.FakeTTS）
+TTS_BACKEND = 'baidu'
+FAKE_TTS_OPTIONS = {'latency': 0.05, 'error_rate': 0.0}
+
+# 分段合成并发线程数（1 = 逐段顺序合成）
+TTS_WORKERS = 4
+
+# 合成任务清单目录（断点续传）与临时性失败的重试策略（指数退避，单位秒）
+JOBS_DIR = os.path.join(AUDIO_FILES_DIR, '.jobs')
+TTS_RETRIES = 4
+TTS_BACKOFF_BASE = 1.0
+TTS_BACKOFF_MAX = 30.0
+
+# 后台合成队列（worker.py 消费）：任务库、轮询间隔与心跳超时（秒）
+JOBS_DB = 'synthesis_jobs.db'
+WORKER_POLL_SECONDS = 2
+WORKER_HEARTBEAT_SECONDS = 10
+WORKER_STALE_SECONDS = 120
+JOB_POLL_SECONDS = 3
+
+# 按收听进度预合成：保持当前分段之后 PREFETCH_AHEAD 段已合成（0 关闭）；
+# worker 每隔 PREFETCH_POLL_SECONDS 扫描最近 PREFETCH_ACTIVE_SECONDS 内有播放记录的书
+PREFETCH_AHEAD = 5
+PREFETCH_POLL_SECONDS = 10
+PREFETCH_ACTIVE_SECONDS = 3600
+# 范围任务失败后暂停该书 + 音色的预合成，连续失败时冷却时间加倍，最长 PREFETCH_RETRY_MAX_SECONDS
+PREFETCH_RETRY_SECONDS = 60
+PREFETCH_RETRY_MAX_SECONDS = 3600
+
+# TTS 音频缓存：目录与磁盘预算（超出后按 LRU 淘汰）
+TTS_CACHE_DIR = 'tts_cache'
+TTS_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# 播放器旁路服务：接收前端位置存档（供浏览器直接访问）
+MEDIA_SERVER_HOST = '0.0.0.0'
+MEDIA_SERVER_PORT = 8502
+# 浏览器访问旁路服务的对外地址，如 'https://radio.example.com/media'；为空时用页面的协议 + 主机名 + 上面的端口。
+# 以下部署必须配置：
+#   - 页面走 HTTPS：旁路服务本身只提供 HTTP，浏览器会拦截 https 页面里的 http 请求（混合内容），
+#     需由反向代理以 https 转发到本端口，并在这里填写该 https 地址；
+#   - 只开放一个端口的反向代理 / 容器平台：把某个路径（如 /media）转发到本端口，并在这里填写该路径
+MEDIA_SERVER_PUBLIC_URL = ''
+# 前端自动存档间隔，以及服务端批量落库间隔（秒）
+POSITION_SAVE_SECONDS = 5
+POSITION_FLUSH_SECONDS = 2
+# 播放器页的播放列表按此间隔局部刷新（秒）；片段 rerun 不会重建播放器
+PLAYLIST_REFRESH_SECONDS = 15
+# 侧边栏显示每次整页 / 片段 rerun 的耗时，保留最近若干次
+RERUN_TIMINGS = True
+RERUN_TIMING_HISTORY = 200
+
+# 会话令牌签名密钥：多副本部署时各实例设置相同的环境变量；
+# 未设置时在本地生成一次并保存到 SESSION_SECRET_FILE（同一台机器上的进程共用）
+SESSION_SECRET = os.environ.get('QRADIO_SESSION_SECRET', '')
+SESSION_SECRET_FILE = '.session_secret'
+SESSION_TTL_SECONDS = 7 * 24 * 3600
+# 播放器访问旁路服务的令牌有效期（秒）：令牌出现在音频 / 导出地址中，比会话令牌短；
+# 每次整页 rerun 都会换发，页面一直开着超过该时长后刷新即可
+MEDIA_TOKEN_TTL_SECONDS = 12 * 3600
+
+# 整章拼接：同一 (书, 音色) 的分段按帧拼成一个 MP3，并写出 seek 索引
+CHAPTERS_DIR = os.path.join(AUDIO_FILES_DIR, 'chapters')
+# 合成进程完成整本后自动拼接（否则在播放器页手动点“合并为整章”）
+CHAPTER_ASSEMBLY = False
 
 # 音色配置
 VOICE_OPTIONS = {
@@ -29,6 +121,8 @@ SPEED_OPTIONS = {
     "2.0x": 2.0
 }
 
-# 创建必要的文件夹
-os.makedirs(BOOKS_DIR, exist_ok=True)
-os.makedirs(AUDIO_FILES_DIR, exist_ok=True)
+
+def ensure_dirs():
+    """创建必要的文件夹：由用到它们的功能调用，导入 config 本身不触碰文件系统"""
+    os.makedirs(BOOKS_DIR, exist_ok=True)
+    os.makedirs(AUDIO_FILES_DIR, exist_ok=True)
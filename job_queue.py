@@ -0,0 +1,218 @@
+import os
+import socket
+import sqlite3
+import time
+from datetime import datetime
+
+import config
+
+# 任务状态：queued → running → done / failed
+ACTIVE_STATUSES = ('queued', 'running')
+
+# first_seg / last_seg：只合成这一范围的分段（按收听进度预合成），NULL 为整本
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    book_file   TEXT NOT NULL,
+    voice_name  TEXT NOT NULL,
+    username    TEXT NOT NULL DEFAULT '',
+    status      TEXT NOT NULL DEFAULT 'queued',
+    done        INTEGER NOT NULL DEFAULT 0,
+    total       INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    worker      TEXT,
+    created_at  TEXT NOT NULL,
+    started_at  TEXT,
+    finished_at TEXT,
+    heartbeat   REAL,
+    first_seg   INTEGER,
+    last_seg    INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id);
+CREATE TABLE IF NOT EXISTS workers (
+    name      TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+"""
+
+
+def connect(db_path: str = None) -> sqlite3.Connection:
+    """打开任务库（WAL 模式，UI 与多个 worker 进程可同时读写）"""
+    conn = sqlite3.connect(db_path or config.JOBS_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(_SCHEMA)
+    _migrate(conn)
+    return conn
+
+
+def _migrate(conn):
+    """旧版任务库没有分段范围列"""
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+    for column in ('first_seg', 'last_seg'):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} INTEGER')
+
+
+def _covers(job, segments) -> bool:
+    if job['first_seg'] is None:
+        return True
+    return segments is not None and job['first_seg'] <= segments[0] and job['last_seg'] >= segments[1]
+
+
+def enqueue(conn, book_file: str, voice_name: str, username: str = '', segments=None) -> int:
+    """提交合成任务，segments=(first, last) 时只合成这一范围的分段
+
+    同一本书 + 音色已有覆盖该范围的排队 / 运行中任务时直接返回它；
+    否则有排队中的任务就扩大它的范围，不重复排队；只有运行中的任务时新建一个，
+    它由 claim_next 排在运行中的任务之后（同一本书 + 音色同时只有一个任务在写分段与清单）
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = conn.execute(
+            'SELECT * FROM jobs WHERE book_file = ? AND voice_name = ? AND status IN (?, ?) ORDER BY id',
+            (book_file, voice_name, *ACTIVE_STATUSES),
+        ).fetchall()
+        covering = [r for r in rows if _covers(r, segments)]
+        queued = [r for r in rows if r['status'] == 'queued']
+        if covering:
+            job_id = covering[0]['id']
+        elif queued:
+            job = queued[0]
+            first, last = (None, None) if segments is None else \
+                (min(job['first_seg'], segments[0]), max(job['last_seg'], segments[1]))
+            conn.execute('UPDATE jobs SET first_seg = ?, last_seg = ? WHERE id = ?', (first, last, job['id']))
+            job_id = job['id']
+        else:
+            first, last = segments or (None, None)
+            job_id = conn.execute(
+                'INSERT INTO jobs (book_file, voice_name, username, created_at, first_seg, last_seg) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (book_file, voice_name, username, datetime.now().isoformat(), first, last),
+            ).lastrowid
+        conn.execute('COMMIT')
+        return job_id
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def retry_after(conn, book_file: str, voice_name: str, base: float, cap: float) -> float:
+    """该书 + 音色最近的范围任务连续失败时还需冷却的秒数，0 表示可以再提交
+
+    冷却时间为 base × 2^(连续失败次数 - 1)，最长 cap，从最后一次失败结束时算起
+    """
+    rows = conn.execute(
+        'SELECT status, heartbeat FROM jobs WHERE book_file = ? AND voice_name = ? AND first_seg IS NOT NULL '
+        'ORDER BY id DESC LIMIT 16',
+        (book_file, voice_name),
+    ).fetchall()
+    failures = 0
+    for row in rows:
+        if row['status'] != 'failed':
+            break
+        failures += 1
+    if not failures:
+        return 0.0
+    cooldown = min(base * 2 ** (failures - 1), cap)
+    return max(0.0, rows[0]['heartbeat'] + cooldown - time.time())
+
+
+def claim_next(conn, worker: str):
+    """原子地领取排队任务，没有任务时返回 None
+
+    预合成（分段范围）任务优先：有人正在等着听；其余按提交顺序。
+    同一本书 + 音色已有运行中的任务时跳过，等它结束（或心跳超时被 requeue_stale 放回）再领取，
+    避免两个 worker 同时写同一批分段与清单
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute(
+            "SELECT * FROM jobs AS j WHERE status = 'queued' AND NOT EXISTS ("
+            "  SELECT 1 FROM jobs AS r WHERE r.status = 'running' "
+            "  AND r.book_file = j.book_file AND r.voice_name = j.voice_name"
+            ") ORDER BY first_seg IS NULL, id LIMIT 1"
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, heartbeat = ?, error = NULL "
+                "WHERE id = ?",
+                (worker, datetime.now().isoformat(), time.time(), row['id']),
+            )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return dict(row) if row else None
+
+
+def touch(conn, job_id: int):
+    """刷新运行中任务的心跳"""
+    conn.execute('UPDATE jobs SET heartbeat = ? WHERE id = ?', (time.time(), job_id))
+
+
+def update_progress(conn, job_id: int, done: int, total: int):
+    conn.execute(
+        'UPDATE jobs SET done = ?, total = ?, heartbeat = ? WHERE id = ?',
+        (done, total, time.time(), job_id),
+    )
+
+
+def finish(conn, job_id: int, error: str = None):
+    conn.execute(
+        'UPDATE jobs SET status = ?, error = ?, finished_at = ?, heartbeat = ? WHERE id = ?',
+        ('failed' if error else 'done', error, datetime.now().isoformat(), time.time(), job_id),
+    )
+
+
+def release(conn, job_id: int):
+    """把运行中的任务放回队列（worker 正常退出时调用）"""
+    conn.execute("UPDATE jobs SET status = 'queued', worker = NULL WHERE id = ? AND status = 'running'", (job_id,))
+
+
+def requeue_stale(conn, timeout: float = None) -> int:
+    """心跳超时的 running 任务（worker 被杀）重新排队，断点续传会接着做"""
+    timeout = config.WORKER_STALE_SECONDS if timeout is None else timeout
+    cur = conn.execute(
+        "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat < ?",
+        (time.time() - timeout,),
+    )
+    return cur.rowcount
+
+
+def get_job(conn, job_id: int):
+    row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def list_jobs(conn, username: str = None, limit: int = 20) -> list[dict]:
+    """最近的任务，username 为空时返回所有用户的任务"""
+    if username is None:
+        rows = conn.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,))
+    else:
+        rows = conn.execute(
+            'SELECT * FROM jobs WHERE username = ? ORDER BY id DESC LIMIT ?', (username, limit)
+        )
+    return [dict(r) for r in rows]
+
+
+def beat(conn, worker: str):
+    """worker 进程存活心跳"""
+    conn.execute(
+        'INSERT INTO workers (name, heartbeat) VALUES (?, ?) '
+        'ON CONFLICT(name) DO UPDATE SET heartbeat = excluded.heartbeat',
+        (worker, time.time()),
+    )
+
+
+def alive_workers(conn, timeout: float = None) -> int:
+    timeout = config.WORKER_STALE_SECONDS if timeout is None else timeout
+    row = conn.execute(
+        'SELECT COUNT(*) AS n FROM workers WHERE heartbeat >= ?', (time.time() - timeout,)
+    ).fetchone()
+    return row['n']
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
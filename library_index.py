@@ -0,0 +1,193 @@
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+
+import config
+import mp3_scan
+
+# generate_segments_mp3 / synthesis.segment_filename 写出的文件名：{书}_{音色}_seg{NNN}.mp3
+_SEGMENT_NAME = re.compile(r'^(?P<book>.+)_(?P<voice>[^_]+)_seg(?P<seg>\d+)\.mp3$')
+
+# book / voice / segment 解析自文件名；不符合命名规则的 mp3 以文件名为书名、voice 为空
+AudioEntry = namedtuple('AudioEntry', 'name book voice segment')
+
+
+def parse_audio_name(name: str) -> AudioEntry:
+    m = _SEGMENT_NAME.match(name)
+    if m:
+        return AudioEntry(name, m.group('book'), m.group('voice'), int(m.group('seg')))
+    return AudioEntry(name, os.path.splitext(name)[0], '', 0)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media_info (
+    name     TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size     INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    frames   INTEGER NOT NULL,
+    bitrate  INTEGER NOT NULL,
+    valid    INTEGER NOT NULL,
+    error    TEXT
+);
+"""
+
+_local = threading.local()
+
+
+def _db() -> sqlite3.Connection:
+    """媒体信息库：合成进程写入、播放器读取（WAL，每线程一个连接）"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(config.LIBRARY_DB, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def save_media_info(name: str, info: dict, stat: os.stat_result):
+    """登记一个音频文件的扫描结果，以 (mtime, size) 判断是否过期"""
+    _db().execute(
+        'INSERT OR REPLACE INTO media_info (name, mtime_ns, size, duration, frames, bitrate, valid, error) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        (name, stat.st_mtime_ns, stat.st_size, info['duration'], info['frames'], info['bitrate'],
+         int(info['valid']), info['error']),
+    )
+
+
+def load_media_info() -> dict:
+    return {row['name']: dict(row) for row in _db().execute('SELECT * FROM media_info')}
+
+
+def load_durations(names) -> dict:
+    """{文件名: 时长}，只按主键读取给定文件中已登记的（未登记的不在结果中）"""
+    names = list(names)
+    durations = {}
+    # 分批查询，不超过 SQLite 的参数个数上限
+    for i in range(0, len(names), 500):
+        batch = names[i:i + 500]
+        placeholders = ','.join('?' * len(batch))
+        durations.update(_db().execute(
+            f'SELECT name, duration FROM media_info WHERE name IN ({placeholders})', batch))
+    return durations
+
+
+class LibraryIndex:
+    """音频库索引：目录 mtime 不变时直接复用上次扫描结果
+
+    条目按 (书, 音色, 分段号) 排序——分段号按数值比较，seg1000 排在 seg999 之后；
+    按文件名查找、上一段 / 下一段都是 O(1)。
+    """
+
+    def __init__(self, audio_dir: str = None):
+        self.audio_dir = audio_dir or config.AUDIO_FILES_DIR
+        self._lock = threading.Lock()
+        self._stamp = None
+        self.entries = []
+        self.groups = {}
+        self._pos = {}
+        self._group_pos = {}
+        self._stamps = {}
+        self._info = {}
+        self._stored = None
+
+    def refresh(self):
+        """目录有变化（mtime 改变）时重新扫描"""
+        try:
+            stamp = os.stat(self.audio_dir).st_mtime_ns
+        except FileNotFoundError:
+            stamp = None
+        with self._lock:
+            if stamp == self._stamp and stamp is not None:
+                return self
+            entries, stamps = [], {}
+            if stamp is not None:
+                with os.scandir(self.audio_dir) as it:
+                    for e in it:
+                        if e.name.endswith('.mp3') and e.is_file():
+                            stat = e.stat()
+                            entries.append(parse_audio_name(e.name))
+                            stamps[e.name] = (stat.st_mtime_ns, stat.st_size)
+            entries.sort(key=lambda e: (e.book, e.voice, e.segment, e.name))
+            groups = {}
+            for entry in entries:
+                groups.setdefault((entry.book, entry.voice), []).append(entry)
+            self.entries = entries
+            self.groups = groups
+            self._pos = {e.name: i for i, e in enumerate(entries)}
+            self._group_pos = {e.name: i for group in groups.values() for i, e in enumerate(group)}
+            self._stamps = stamps
+            self._stored = None
+            self._stamp = stamp
+        return self
+
+    @property
+    def stamp(self):
+        """目录版本（mtime），可作为依赖音频库的缓存键"""
+        return self._stamp
+
+    def files(self) -> list[str]:
+        return [e.name for e in self.entries]
+
+    def get(self, name: str):
+        i = self._pos.get(name)
+        return self.entries[i] if i is not None else None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._pos
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def group_of(self, name: str) -> list[AudioEntry]:
+        entry = self.get(name)
+        return self.groups.get((entry.book, entry.voice), []) if entry else []
+
+    def media_info(self, name: str) -> dict:
+        """时长 / 帧数 / 完整性：依次取内存缓存、媒体信息库，都过期时才扫描帧头"""
+        stamp = self._stamps.get(name)
+        if stamp is None:
+            return None
+        info = self._info.get(name)
+        if info and (info['mtime_ns'], info['size']) == stamp:
+            return info
+        if self._stored is None:
+            self._stored = load_media_info()
+        info = self._stored.get(name)
+        if not info or (info['mtime_ns'], info['size']) != stamp:
+            path = os.path.join(self.audio_dir, name)
+            try:
+                scanned = mp3_scan.scan_file(path)
+                stat = os.stat(path)
+            except OSError:
+                return None
+            save_media_info(name, scanned, stat)
+            info = {'name': name, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                    **{k: scanned[k] for k in ('duration', 'frames', 'bitrate', 'valid', 'error')}}
+        self._info[name] = info
+        return info
+
+    def duration(self, name: str) -> float:
+        info = self.media_info(name)
+        return info['duration'] if info else 0.0
+
+    def group_index(self, name: str) -> int:
+        """name 在所属 (书, 音色) 分组中的下标"""
+        return self._group_pos[name]
+
+    def neighbor(self, name: str, step: int) -> str:
+        """上一段 / 下一段：按书、音色、分段号的全局顺序，首尾循环"""
+        i = self._pos[name]
+        return self.entries[(i + step) % len(self.entries)].name
+
+    def next_in_group(self, name: str):
+        """同一本书同一音色的下一段，已是最后一段时返回 None"""
+        i = self._pos.get(name)
+        if i is None or i + 1 >= len(self.entries):
+            return None
+        cur, nxt = self.entries[i], self.entries[i + 1]
+        return nxt.name if (nxt.book, nxt.voice) == (cur.book, cur.voice) else None
@@ -0,0 +1,307 @@
+"""播放器旁路 HTTP 服务：音频流与位置存档都不经过 Streamlit 的 rerun
+
+GET  /audio/<文件名>  支持 HTTP Range 的分块音频流，跳转时只取需要的字节
+                     （整章文件为 /audio/chapters/<文件名>）
+GET  /position       读取已保存的位置（含尚未落库的最新值）
+POST /position       前端每隔几秒以及在暂停 / 播完 / 关闭页面时上报位置（媒体时间，与播放速度无关），
+                     服务端按 (用户, 文件) 只保留最新值，定时批量写入 playback_store
+GET  /export         整本 ZIP（分段 / 清单 / CUE / 播放记录），分块传输、边打包边发送
+GET  /speed          读取某本书的播放速度
+POST /speed          播放器里切换速度时保存（每个用户每本书一个值）
+"""
+import atexit
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import book_export
+import config
+import playback_store
+from user_config import session_secret
+
+MAX_BODY_BYTES = 4096
+STREAM_BLOCK_BYTES = 64 * 1024
+
+_RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+def _token_sig(username: str, exp: int) -> str:
+    # 与会话令牌共用密钥：多副本部署时任一实例签发的令牌都能在其他实例使用
+    payload = f"position:{username}:{exp}".encode('utf-8')
+    return hmac.new(session_secret(), payload, hashlib.sha256).hexdigest()
+
+
+def position_token(username: str) -> str:
+    """签发给前端的访问令牌 用户名:过期时间:签名，证明请求来自哪个已登录用户（音频流与位置存档共用）
+
+    令牌会出现在音频 / 导出地址的查询串里，因此带过期时间；过期时间取整到整点，
+    同一小时内签发的令牌相同，整页 rerun 时播放器 iframe 不会因令牌变化而重建
+    """
+    exp = -(-(int(time.time()) + config.MEDIA_TOKEN_TTL_SECONDS) // 3600) * 3600
+    return f"{username}:{exp}:{_token_sig(username, exp)}"
+
+
+def verify_position_token(token: str):
+    """令牌有效且未过期时返回用户名，否则返回 None"""
+    parts = (token or '').rsplit(':', 2)
+    if len(parts) != 3 or not parts[1].isdigit():
+        return None
+    username, exp, sig = parts[0], int(parts[1]), parts[2]
+    if exp <= time.time():
+        return None
+    expected = _token_sig(username, exp)
+    return username if hmac.compare_digest(sig.encode('utf-8'), expected.encode('utf-8')) else None
+
+
+class PositionBatcher:
+    """合并位置更新：同一 (用户, 文件) 只保留最新值，每隔 interval 秒批量落库"""
+
+    def __init__(self, interval: float = None):
+        self.interval = config.POSITION_FLUSH_SECONDS if interval is None else interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def pending_position(self, username: str, audio_file: str):
+        """尚未落库的最新位置，没有时返回 None"""
+        with self._lock:
+            value = self._pending.get((username, audio_file))
+        return value[0] if value else None
+
+    def add(self, username: str, audio_file: str, position: float, completed: bool = False):
+        with self._lock:
+            prev = self._pending.get((username, audio_file))
+            completed = completed or (prev is not None and prev[1])
+            self._pending[(username, audio_file)] = (position, completed)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        items = [(u, f, pos, done) for (u, f), (pos, done) in pending.items()]
+        try:
+            playback_store.update_positions(items)
+        except Exception as e:
+            print(f"批量保存播放位置失败: {e}")
+            with self._lock:
+                for (u, f), value in pending.items():
+                    self._pending.setdefault((u, f), value)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # 所有响应都带 Content-Length，可以复用连接
+    protocol_version = 'HTTP/1.1'
+    batcher: PositionBatcher = None
+
+    def _cors(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+
+    def _reply(self, code: int, body: bytes = b'', content_type: str = None):
+        self.send_response(code)
+        self._cors()
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_OPTIONS(self):
+        self._reply(204)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        username = verify_position_token(query.get('token', [''])[0])
+        if username is None:
+            return self._reply(403)
+        if url.path.startswith('/audio/'):
+            return self._send_audio(unquote(url.path[len('/audio/'):]))
+        if url.path == '/position':
+            audio_file = query.get('file', [''])[0]
+            position = self.batcher.pending_position(username, audio_file)
+            if position is None:
+                record = playback_store.get_record(username, audio_file) or {}
+                position = record.get('last_position', 0)
+            body = json.dumps({'file': audio_file, 'position': position}).encode('utf-8')
+            return self._reply(200, body, 'application/json')
+        if url.path == '/export':
+            return self._send_export(username, query.get('book', [''])[0], query.get('voice', [''])[0])
+        if url.path == '/speed':
+            book = query.get('book', [''])[0]
+            body = json.dumps({'book': book, 'speed': playback_store.get_speed(username, book)}).encode('utf-8')
+            return self._reply(200, body, 'application/json')
+        self._reply(404)
+
+    def _send_audio(self, name: str):
+        """按 Range 分块发送音频，内存占用与文件大小无关"""
+        folder, _, base = name.rpartition('/')
+        if folder and os.path.join(config.AUDIO_FILES_DIR, folder) != config.CHAPTERS_DIR:
+            return self._reply(404)
+        if not base.endswith('.mp3') or base.startswith('.') or '\\' in base:
+            return self._reply(404)
+        path = os.path.join(config.AUDIO_FILES_DIR, folder, base)
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            return self._reply(404)
+        with f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            start, end = 0, size - 1
+            status = 200
+            m = _RANGE.match(self.headers.get('Range', ''))
+            if m and (m.group(1) or m.group(2)):
+                if m.group(1):
+                    start = int(m.group(1))
+                    end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+                else:
+                    start = max(0, size - int(m.group(2)))
+                if start >= size or start > end:
+                    self.send_response(416)
+                    self._cors()
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                status = 206
+            self.send_response(status)
+            self._cors()
+            self.send_header('Content-Type', 'audio/mpeg')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Last-Modified', formatdate(stat.st_mtime, usegmt=True))
+            self.send_header('ETag', f'"{stat.st_mtime_ns:x}-{size:x}"')
+            self.send_header('Cache-Control', 'private, max-age=3600')
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.end_headers()
+            if self.command == 'HEAD':
+                return
+            f.seek(start)
+            remaining = end - start + 1
+            try:
+                while remaining > 0:
+                    block = f.read(min(STREAM_BLOCK_BYTES, remaining))
+                    if not block:
+                        break
+                    self.wfile.write(block)
+                    remaining -= len(block)
+            except (BrokenPipeError, ConnectionResetError):
+                # 浏览器跳转时会主动断开旧的 Range 请求
+                pass
+
+    def _send_export(self, username: str, book: str, voice: str):
+        """整本 ZIP：总长度事先不确定，用分块传输编码；小片段攒到一个读块再写出"""
+        entries = book_export.book_entries(username, book, voice)
+        if not entries:
+            return self._reply(404)
+        filename = quote(f"{book}_{voice}.zip")
+        self.send_response(200)
+        self._cors()
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Disposition', f"attachment; filename=\"export.zip\"; filename*=UTF-8''{filename}")
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        buffer = bytearray()
+        try:
+            for block in book_export.iter_zip(entries):
+                buffer += block
+                if len(buffer) >= book_export.READ_SIZE:
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(buffer), buffer))
+                    buffer.clear()
+            if buffer:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(buffer), buffer))
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except OSError as e:
+            # 分段在导出途中被删除：响应头已发出，只能断开连接让下载失败
+            print(f"导出 {book} / {voice} 失败: {e}")
+            self.close_connection = True
+
+    def do_POST(self):
+        handler = {'/position': self._post_position, '/speed': self._post_speed}.get(self.path)
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if handler is None or not 0 < length <= MAX_BODY_BYTES:
+            # 请求体没有读出：保持连接的话它会被当成下一个请求解析，直接断开
+            self.close_connection = True
+            return self._reply(400 if handler else 404)
+        try:
+            data = json.loads(self.rfile.read(length))
+            username = verify_position_token(data.get('token'))
+        except (ValueError, AttributeError):
+            return self._reply(400)
+        if username is None:
+            return self._reply(403)
+        try:
+            handler(username, data)
+        except (ValueError, KeyError, TypeError):
+            self._reply(400)
+
+    def _post_speed(self, username: str, data: dict):
+        book = str(data['book'])
+        speed = float(data['speed'])
+        if speed not in config.SPEED_OPTIONS.values():
+            raise ValueError(speed)
+        playback_store.set_speed(username, book, speed)
+        self._reply(204)
+
+    def _post_position(self, username: str, data: dict):
+        audio_file = str(data['file'])
+        position = max(0.0, float(data.get('position', 0)))
+        event = data.get('event', 'tick')
+        if event == 'ended':
+            # 播完：与“标记完成”一致，位置归零
+            self.batcher.add(username, audio_file, 0, completed=True)
+        else:
+            self.batcher.add(username, audio_file, position)
+        self._reply(204)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    # 默认 backlog 只有 5，大量听众同时连入时会丢 SYN、重传等待数秒
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def start_server(host: str = None, port: int = None):
+    """在后台线程启动服务，返回 (server, batcher)"""
+    batcher = PositionBatcher()
+    handler = type('Handler', (_Handler,), {'batcher': batcher})
+    server = _Server((host or config.MEDIA_SERVER_HOST,
+                      config.MEDIA_SERVER_PORT if port is None else port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    atexit.register(batcher.close)
+    return server, batcher
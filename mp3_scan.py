@@ -0,0 +1,123 @@
+"""只解析 MP3 帧头、不解码音频：计算时长并检查帧是否完整
+
+百度 TTS 的 aue=6 输出是不带 RIFF 头的 MPEG 音频流，
+逐帧读 4 字节帧头即可得到采样率、码率与帧长。
+"""
+
+# 码率表（kbps），按 (MPEG 版本是否为 1, 层) 索引
+_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# 采样率表，按版本位（0=MPEG2.5, 2=MPEG2, 3=MPEG1）索引
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def parse_frame_header(b0: int, b1: int, b2: int):
+    """解析帧头前 3 字节，返回 (帧长, 每帧采样数, 采样率, 码率kbps)；不是合法帧头时返回 None"""
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = (b1 >> 3) & 0x03
+    layer = 4 - ((b1 >> 1) & 0x03)
+    bitrate_idx = (b2 >> 4) & 0x0F
+    rate_idx = (b2 >> 2) & 0x03
+    if version == 1 or layer == 4 or bitrate_idx in (0, 15) or rate_idx == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_idx]
+    sample_rate = _SAMPLE_RATES[version][rate_idx]
+    padding = (b2 >> 1) & 0x01
+    if layer == 1:
+        return (12 * bitrate * 1000 // sample_rate + padding) * 4, 384, sample_rate, bitrate
+    if layer == 3 and not mpeg1:
+        return 72 * bitrate * 1000 // sample_rate + padding, 576, sample_rate, bitrate
+    return 144 * bitrate * 1000 // sample_rate + padding, 1152, sample_rate, bitrate
+
+
+def id3v2_size(data: bytes, offset: int = 0) -> int:
+    """offset 处 ID3v2 标签的总长度（含 10 字节头与可选的页脚），没有标签时为 0"""
+    if data[offset:offset + 3] != b'ID3' or len(data) < offset + 10:
+        return 0
+    size = 0
+    for b in data[offset + 6:offset + 10]:
+        size = (size << 7) | (b & 0x7F)
+    footer = 10 if data[offset + 5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def info_frame_length(data: bytes, offset: int) -> int:
+    """offset 处的首帧若是 Xing / Info / VBRI 信息帧（只含整段的帧数统计，不含声音），
+    返回其帧长，否则返回 0。拼接多个文件时必须去掉，否则播放器会按第一段的帧数计算总时长"""
+    if len(data) < offset + 4:
+        return 0
+    header = parse_frame_header(data[offset], data[offset + 1], data[offset + 2])
+    if header is None:
+        return 0
+    mpeg1 = (data[offset + 1] >> 3) & 0x03 == 3
+    mono = (data[offset + 3] >> 6) & 0x03 == 3
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    tag = data[offset + 4 + side_info:offset + 8 + side_info]
+    if tag in (b'Xing', b'Info') or data[offset + 36:offset + 40] == b'VBRI':
+        return header[0]
+    return 0
+
+
+def scan_bytes(data: bytes) -> dict:
+    """
+    逐帧扫描 MP3 字节流
+    返回 {'valid', 'duration', 'frames', 'sample_rate', 'bitrate', 'audio_offset', 'audio_end', 'error'}：
+    duration 为秒；bitrate 为平均 kbps；[audio_offset, audio_end) 是完整音频帧所在的字节范围
+    （跳过 ID3v2 / ID3v1 标签与残缺的末帧）
+    """
+    result = {'valid': False, 'duration': 0.0, 'frames': 0, 'sample_rate': 0,
+              'bitrate': 0, 'audio_offset': 0, 'audio_end': 0, 'error': None}
+    pos = id3v2_size(data)
+    result['audio_offset'] = pos
+    end = len(data)
+    # 文件尾的 ID3v1 标签不是音频帧
+    if end - pos >= 128 and data[end - 128:end - 125] == b'TAG':
+        end -= 128
+
+    samples, total_bits, sample_rate = 0, 0, 0
+    while pos + 4 <= end:
+        header = parse_frame_header(data[pos], data[pos + 1], data[pos + 2])
+        if header is None:
+            result['error'] = f"偏移 {pos} 处不是帧头"
+            break
+        frame_len, frame_samples, rate, bitrate = header
+        if sample_rate and rate != sample_rate:
+            result['error'] = f"偏移 {pos} 处采样率变化"
+            break
+        if pos + frame_len > end:
+            result['error'] = f"最后一帧被截断（偏移 {pos}）"
+            break
+        sample_rate = rate
+        samples += frame_samples
+        total_bits += bitrate * 1000 * frame_samples / rate
+        result['frames'] += 1
+        pos += frame_len
+    else:
+        if pos != end:
+            result['error'] = f"末尾有 {end - pos} 字节残缺数据"
+    result['audio_end'] = pos
+
+    if result['frames'] == 0:
+        result['error'] = result['error'] or "没有找到 MPEG 音频帧"
+        return result
+    duration = samples / sample_rate
+    result.update(
+        valid=result['error'] is None,
+        duration=duration,
+        sample_rate=sample_rate,
+        bitrate=round(total_bits / duration / 1000) if duration else 0,
+    )
+    return result
+
+
+def scan_file(path: str) -> dict:
+    with open(path, 'rb') as f:
+        return scan_bytes(f.read())
@@ -0,0 +1,310 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import config
+from library_index import load_durations, parse_audio_name
+
+# 旧版 playback_records.json 中的记录不区分用户，迁移后归到这个用户名下，
+# 所有用户都能读到；某个用户第一次更新时复制一份到自己名下
+LEGACY_USER = ''
+
+_FIELDS = ('last_played', 'play_count', 'total_play_time', 'last_position', 'duration', 'completed')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS playback_records (
+    username        TEXT NOT NULL DEFAULT '',
+    audio_file      TEXT NOT NULL,
+    last_played     TEXT,
+    play_count      INTEGER NOT NULL DEFAULT 0,
+    total_play_time REAL NOT NULL DEFAULT 0,
+    last_position   REAL NOT NULL DEFAULT 0,
+    duration        REAL NOT NULL DEFAULT 0,
+    completed       INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, audio_file)
+);
+CREATE INDEX IF NOT EXISTS idx_records_file ON playback_records(audio_file);
+-- 追加写入的播放事件：play / complete / position，clear 为清空记录的标记
+CREATE TABLE IF NOT EXISTS play_events (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts         TEXT NOT NULL,
+    username   TEXT NOT NULL,
+    audio_file TEXT NOT NULL,
+    event      TEXT NOT NULL,
+    position   REAL NOT NULL DEFAULT 0,
+    listened   REAL NOT NULL DEFAULT 0
+);
+-- 按 (日期, 用户, 书目) 汇总，与事件在同一事务中增量更新
+CREATE TABLE IF NOT EXISTS play_rollups (
+    day         TEXT NOT NULL,
+    username    TEXT NOT NULL,
+    book        TEXT NOT NULL,
+    plays       INTEGER NOT NULL DEFAULT 0,
+    completions INTEGER NOT NULL DEFAULT 0,
+    saves       INTEGER NOT NULL DEFAULT 0,
+    listened    REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, username, book)
+);
+-- 每个用户每本书的播放速度（前端 playbackRate，不影响保存的位置：位置始终是媒体时间）
+CREATE TABLE IF NOT EXISTS book_speeds (
+    username TEXT NOT NULL,
+    book     TEXT NOT NULL,
+    speed    REAL NOT NULL,
+    PRIMARY KEY (username, book)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_local = threading.local()
+
+
+def connect(db_path: str = None) -> sqlite3.Connection:
+    """每个线程一个连接（WAL 模式：读写互不阻塞，多个会话可同时写）"""
+    db_path = db_path or config.PLAYBACK_DB
+    if not hasattr(_local, 'conns'):
+        _local.conns = {}
+    conn = _local.conns.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        _migrate_json(conn)
+        _local.conns[db_path] = conn
+    return conn
+
+
+def _migrate_json(conn):
+    """一次性把 playback_records.json 导入数据库（只执行一次，原文件保留）"""
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+        return
+    records = {}
+    if os.path.exists(config.PLAYBACK_RECORDS_FILE):
+        try:
+            with open(config.PLAYBACK_RECORDS_FILE, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            records = {}
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if not conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            conn.executemany(
+                'INSERT OR IGNORE INTO playback_records (username, audio_file, last_played, play_count, '
+                'total_play_time, last_position, duration, completed) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (LEGACY_USER, name, r.get('last_played'), r.get('play_count', 0),
+                     r.get('total_play_time', 0), r.get('last_position', 0), r.get('duration', 0),
+                     int(bool(r.get('completed', False))))
+                    for name, r in records.items()
+                ],
+            )
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (datetime.now().isoformat(),)
+            )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def _to_record(row) -> dict:
+    record = {k: row[k] for k in _FIELDS}
+    record['completed'] = bool(record['completed'])
+    return record
+
+
+def get_records(username: str = LEGACY_USER) -> dict:
+    """{音频文件: 记录}，用户自己的记录覆盖迁移来的旧记录"""
+    rows = connect().execute(
+        'SELECT * FROM playback_records WHERE username IN (?, ?) ORDER BY username = ?',
+        (username, LEGACY_USER, username),
+    )
+    return {row['audio_file']: _to_record(row) for row in rows}
+
+
+def get_record(username: str, audio_file: str):
+    """按 (用户, 文件) 走主键索引读取单条记录，没有时返回 None"""
+    row = connect().execute(
+        'SELECT * FROM playback_records WHERE username IN (?, ?) AND audio_file = ? '
+        'ORDER BY username = ? DESC LIMIT 1',
+        (username, LEGACY_USER, audio_file, username),
+    ).fetchone()
+    return _to_record(row) if row else None
+
+
+def recent_records(since: str) -> list[dict]:
+    """last_played 不早于 since（ISO 时间）的记录，按播放时间先后排列"""
+    rows = connect().execute(
+        'SELECT username, audio_file, last_played, last_position, completed FROM playback_records '
+        'WHERE last_played >= ? ORDER BY last_played', (since,),
+    )
+    return [dict(row) for row in rows]
+
+
+def book_of(audio_file: str) -> str:
+    """汇总用的书目名：分段文件取文件名中的书名，整章文件（chapters/书_音色.mp3）去掉音色"""
+    folder, _, name = audio_file.rpartition('/')
+    book = parse_audio_name(name).book
+    if folder:
+        book = book.rpartition('_')[0] or book
+    return book
+
+
+def _log_event(conn, username: str, audio_file: str, event: str, position: float, now: str):
+    """追加一条事件并更新当天的汇总
+
+    收听时长取两次存档之间的位置增量（媒体时间）：前端只在播放时定时存档，
+    超过 3 个存档间隔（按最快播放速度折算）的跳跃视为拖动进度条，不计入
+    """
+    listened = 0.0
+    max_delta = config.POSITION_SAVE_SECONDS * 3 * max(config.SPEED_OPTIONS.values(), default=1.0)
+    if event == 'position':
+        row = conn.execute(
+            'SELECT last_position FROM playback_records WHERE username IN (?, ?) AND audio_file = ? '
+            'ORDER BY username = ? DESC LIMIT 1',
+            (username, LEGACY_USER, audio_file, username),
+        ).fetchone()
+        delta = position - (row['last_position'] if row else 0)
+        if 0 < delta <= max_delta:
+            listened = delta
+    conn.execute(
+        'INSERT INTO play_events (ts, username, audio_file, event, position, listened) VALUES (?, ?, ?, ?, ?, ?)',
+        (now, username, audio_file, event, position, listened),
+    )
+    conn.execute(
+        'INSERT INTO play_rollups (day, username, book, plays, completions, saves, listened) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT(day, username, book) DO UPDATE SET '
+        'plays = plays + excluded.plays, completions = completions + excluded.completions, '
+        'saves = saves + excluded.saves, listened = listened + excluded.listened',
+        (now[:10], username, book_of(audio_file), int(event in ('play', 'complete')),
+         int(event == 'complete'), int(event == 'position'), listened),
+    )
+
+
+def _upsert(conn, username: str, audio_file: str, position: float, duration: float,
+            plays: int, completed: int, now: str):
+    _log_event(conn, username, audio_file,
+               'complete' if completed else 'play' if plays else 'position', position, now)
+    if username != LEGACY_USER:
+        # 首次更新时以迁移来的旧记录为起点
+        conn.execute(
+            'INSERT OR IGNORE INTO playback_records (username, audio_file, last_played, play_count, '
+            'total_play_time, last_position, duration, completed) '
+            'SELECT ?, audio_file, last_played, play_count, total_play_time, last_position, duration, '
+            'completed FROM playback_records WHERE username = ? AND audio_file = ?',
+            (username, LEGACY_USER, audio_file),
+        )
+    conn.execute(
+        'INSERT INTO playback_records (username, audio_file, last_played, play_count, last_position, '
+        'duration, completed) VALUES (?, ?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT(username, audio_file) DO UPDATE SET '
+        'last_played = excluded.last_played, '
+        'last_position = excluded.last_position, '
+        'play_count = play_count + excluded.play_count, '
+        'completed = completed OR excluded.completed, '
+        'duration = CASE WHEN excluded.duration > 0 THEN excluded.duration ELSE duration END',
+        (username, audio_file, now, plays, position, duration, completed),
+    )
+
+
+def update_record(username: str, audio_file: str, position: float = 0, duration: float = 0,
+                  status: str = "playing") -> dict:
+    """单条记录的原子 upsert，开销与记录总数无关
+
+    status：playing / completed 计一次播放，completed 同时标记完成；
+    position 只保存位置（自动存档用）
+    """
+    conn = connect()
+    plays = 1 if status in ("playing", "completed") else 0
+    completed = 1 if status == "completed" else 0
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        _upsert(conn, username, audio_file, position, duration, plays, completed,
+                datetime.now().isoformat())
+        row = conn.execute(
+            'SELECT * FROM playback_records WHERE username = ? AND audio_file = ?', (username, audio_file)
+        ).fetchone()
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return _to_record(row)
+
+
+def update_positions(items):
+    """批量保存位置：[(用户, 文件, 位置, 是否播完)]，一个事务写完
+
+    时长取合成时登记在媒体信息库中的值，自动存档新建的记录也有时长
+    """
+    if not items:
+        return
+    durations = load_durations({audio_file for _, audio_file, _, _ in items})
+    conn = connect()
+    now = datetime.now().isoformat()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for username, audio_file, position, completed in items:
+            _upsert(conn, username, audio_file, position, durations.get(audio_file, 0),
+                    int(completed), int(completed), now)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def get_speed(username: str, book: str) -> float:
+    row = connect().execute(
+        'SELECT speed FROM book_speeds WHERE username = ? AND book = ?', (username, book)
+    ).fetchone()
+    return row['speed'] if row else 1.0
+
+
+def set_speed(username: str, book: str, speed: float):
+    connect().execute(
+        'INSERT INTO book_speeds (username, book, speed) VALUES (?, ?, ?) '
+        'ON CONFLICT(username, book) DO UPDATE SET speed = excluded.speed',
+        (username, book, speed),
+    )
+
+
+def last_event_id() -> int:
+    """事件日志的偏移：只增不减（清空记录时也会追加标记），可作为统计缓存的键"""
+    row = connect().execute("SELECT seq FROM sqlite_sequence WHERE name = 'play_events'").fetchone()
+    return row['seq'] if row else 0
+
+
+def get_rollups(username: str = None) -> list[dict]:
+    """按日 / 用户 / 书目的汇总行，username 为空时返回所有用户"""
+    sql = 'SELECT day, username, book, plays, completions, saves, listened FROM play_rollups'
+    rows = connect().execute(sql + ' WHERE username = ?', (username,)) if username is not None \
+        else connect().execute(sql)
+    return [dict(row) for row in rows]
+
+
+def clear_records(username: str, include_legacy: bool = False):
+    """清空一个用户的播放记录与汇总；include_legacy 时连同迁移来的公共旧记录（仅管理员）
+
+    事件日志只追加不删除，这里只追加一条 clear 标记（同时让按日志偏移缓存的统计失效）
+    """
+    users = (username, LEGACY_USER) if include_legacy else (username,)
+    placeholders = ','.join('?' * len(users))
+    conn = connect()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(f'DELETE FROM playback_records WHERE username IN ({placeholders})', users)
+        conn.execute(f'DELETE FROM play_rollups WHERE username IN ({placeholders})', users)
+        conn.execute(
+            "INSERT INTO play_events (ts, username, audio_file, event) VALUES (?, ?, '', 'clear')",
+            (datetime.now().isoformat(), username),
+        )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
@@ -0,0 +1,174 @@
+"""播放器前端：iframe 内的 <audio> 直接从旁路服务按 Range 拉流
+
+页面 HTML 只依赖 (文件, 用户)，rerun 时内容不变，iframe 不会重建、播放不会中断；
+起播位置在前端读取：优先地址栏的 t_live，否则向旁路服务查询已保存的位置；
+播放整章时 cfg.range 为所选分段的 [起始, 结束) 时间，已保存的位置不在其中时从分段开头播放。
+连续播放时预取下一段到备用的 <audio>，播完在前端直接切换，位置与播放次数异步上报。
+播放速度在前端切换（playbackRate，保持音高），按 (用户, 书) 保存在旁路服务；
+速度不参与页面 HTML，切换时不会重建 iframe。位置始终是媒体时间，与速度无关。
+"""
+import json
+
+import streamlit as st
+
+PLAYER_HEIGHT = 64
+
+_TEMPLATE = """
+<div style="display:flex;align-items:center;gap:6px">
+<audio id="player" controls preload="metadata" style="flex:1;min-width:0"></audio>
+<audio id="spare" controls preload="auto" style="flex:1;min-width:0;display:none"></audio>
+<select id="speed" title="播放速度"></select>
+</div>
+<script>
+(function(){
+    const cfg = __CONFIG__;
+    let aud = document.getElementById('player');
+    let spare = document.getElementById('spare');
+    const base = cfg.endpoint || `${parent.location.protocol}//${parent.location.hostname}:${cfg.port}`;
+    const auth = 'token=' + encodeURIComponent(cfg.token);
+    // 连续播放：cfg.playlist 为同一书目 / 音色中从当前段开始的后续分段
+    const playlist = cfg.playlist || [cfg.file];
+    let idx = 0;
+    let file = playlist[0];
+    let lastSent = null;
+    let lastUrlSec = -1;
+
+    function audioUrl(name) {
+        return `${base}/audio/${encodeURIComponent(name)}?${auth}`;
+    }
+    function setUrl(params) {
+        const url = new URL(parent.location);
+        for (const [k, v] of Object.entries(params)) url.searchParams.set(k, v);
+        parent.history.replaceState(null, null, url);
+    }
+    function save(event) {
+        const position = aud.currentTime;
+        if (event === 'tick' && lastSent !== null && Math.abs(position - lastSent) < 0.5) return;
+        lastSent = position;
+        // text/plain 属于简单请求，跨端口也不需要预检
+        const body = JSON.stringify({token: cfg.token, file, position, event});
+        if (event === 'unload') {
+            navigator.sendBeacon(base + '/position', new Blob([body], {type: 'text/plain'}));
+        } else {
+            fetch(base + '/position', {method: 'POST', body, keepalive: true,
+                headers: {'Content-Type': 'text/plain'}}).catch(() => {});
+        }
+    }
+    async function startPosition() {
+        const live = parseFloat(new URL(parent.location).searchParams.get('t_live'));
+        if (live > 0) return live;
+        let saved = 0;
+        try {
+            const resp = await fetch(`${base}/position?file=${encodeURIComponent(file)}&${auth}`);
+            saved = (await resp.json()).position || 0;
+        } catch (e) {}
+        if (cfg.range && (saved < cfg.range[0] || saved >= cfg.range[1])) return cfg.range[0];
+        return saved;
+    }
+    // 倍速：两个 <audio> 同时设置 defaultPlaybackRate，切换分段（load）后速度不会复位
+    const speedSelect = document.getElementById('speed');
+    for (const [label, rate] of Object.entries(cfg.speeds || {})) speedSelect.add(new Option(label, rate));
+    speedSelect.style.display = speedSelect.options.length ? '' : 'none';
+    function applySpeed(rate) {
+        for (const el of [aud, spare]) {
+            el.preservesPitch = el.mozPreservesPitch = el.webkitPreservesPitch = true;
+            el.defaultPlaybackRate = rate;
+            el.playbackRate = rate;
+        }
+        speedSelect.value = String(rate);
+    }
+    speedSelect.addEventListener('change', () => {
+        const speed = parseFloat(speedSelect.value);
+        applySpeed(speed);
+        fetch(base + '/speed', {method: 'POST', body: JSON.stringify({token: cfg.token, book: cfg.book, speed}),
+            headers: {'Content-Type': 'text/plain'}}).catch(() => {});
+    });
+    fetch(`${base}/speed?book=${encodeURIComponent(cfg.book)}&${auth}`)
+        .then(resp => resp.json()).then(data => applySpeed(data.speed || 1)).catch(() => {});
+
+    // 当前段可以完整播放后，用备用的 <audio> 预取下一段
+    function prefetch() {
+        const next = playlist[idx + 1];
+        if (!cfg.continuous || !next || spare.dataset.file === next) return;
+        spare.dataset.file = next;
+        spare.src = audioUrl(next);
+        spare.load();
+    }
+    // 播完后直接切到已缓冲好的下一段，不经过 Streamlit；
+    // 地址栏的 f / t_live 同步更新，之后的 rerun 与刷新都从这里继续
+    function advance() {
+        const next = playlist[idx + 1];
+        if (!cfg.continuous || !next) return;
+        if (spare.dataset.file !== next) prefetch();
+        [aud, spare] = [spare, aud];
+        aud.style.display = '';
+        spare.style.display = 'none';
+        spare.removeAttribute('src');
+        delete spare.dataset.file;
+        idx += 1;
+        file = next;
+        lastSent = null;
+        lastUrlSec = -1;
+        setUrl({f: file, t_live: '0'});
+        aud.play().catch(() => {});
+        // 换上来的这段通常早已触发过 canplaythrough，不会再触发：已缓冲好就立即预取再下一段
+        if (aud.readyState >= 4) prefetch();
+        else aud.addEventListener('canplaythrough', prefetch, {once: true});
+    }
+
+    for (const el of [aud, spare]) {
+        el.addEventListener('canplaythrough', () => { if (el === aud) prefetch(); });
+        el.addEventListener('timeupdate', () => {
+            if (el !== aud) return;
+            const sec = Math.floor(aud.currentTime);
+            if (sec === lastUrlSec) return;
+            lastUrlSec = sec;
+            setUrl({t_live: aud.currentTime.toFixed(1)});
+        });
+        el.addEventListener('pause', () => { if (el === aud && !aud.ended) save('pause'); });
+        el.addEventListener('ended', () => {
+            if (el !== aud) return;
+            setUrl({t_live: '0'});
+            // 播完计一次播放，由旁路服务异步落库
+            save('ended');
+            advance();
+        });
+    }
+
+    // 先定位再加载：浏览器只按 Range 请求起播位置附近的数据
+    aud.addEventListener('loadedmetadata', async () => {
+        const start = await startPosition();
+        if (start > 0 && start < aud.duration) aud.currentTime = start;
+    }, {once: true});
+    setInterval(() => { if (!aud.paused) save('tick'); }, cfg.interval);
+    window.addEventListener('pagehide', () => { if (aud.currentTime > 0 && !aud.ended) save('unload'); });
+    aud.src = audioUrl(file);
+})();
+</script>
+"""
+
+
+_EXPORT_TEMPLATE = """
+<a id="export" target="_blank" style="font-family:sans-serif;font-size:14px;color:inherit">__LABEL__</a>
+<script>
+(function(){
+    const cfg = __CONFIG__;
+    const base = cfg.endpoint || `${parent.location.protocol}//${parent.location.hostname}:${cfg.port}`;
+    const query = new URLSearchParams({book: cfg.book, voice: cfg.voice, token: cfg.token});
+    document.getElementById('export').href = `${base}/export?${query}`;
+})();
+</script>
+"""
+
+
+def render_export_link(cfg: dict, label: str):
+    """整本 ZIP 的下载链接：与播放器一样由前端拼出旁路服务地址；cfg：endpoint / port / token / book / voice"""
+    html = _EXPORT_TEMPLATE.replace('__CONFIG__', json.dumps(cfg)).replace('__LABEL__', label)
+    st.components.v1.html(html, height=28)
+
+
+def render_player(cfg: dict):
+    """cfg：endpoint / port / token / file / book / speeds / interval / range / continuous / playlist，
+    见 app.show_player_interface"""
+    html = _TEMPLATE.replace('__CONFIG__', json.dumps(cfg))
+    st.components.v1.html(html, height=PLAYER_HEIGHT)
@@ -0,0 +1,84 @@
+"""按收听进度预合成：每本在听的书，始终保持当前分段之后 PREFETCH_AHEAD 段已合成
+
+不必等整本书合成完：第 1 段合成好就可以开始听，之后由收听进度驱动——
+播放器页每次 rerun、worker 空闲时扫描最近的播放记录，发现当前分段之后缺段，
+就向任务队列提交一个分段范围任务（job_queue.enqueue(segments=...)）。
+接口调用量随实际收听增长，没人听的部分不会合成。
+范围任务失败（配额用完、文本无法合成等）后按指数退避暂停该书 + 音色的预合成，
+不会每次 rerun / 扫描都重新提交一个注定失败的任务。
+"""
+import os
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import config
+import job_queue
+import playback_store
+from book_reader import book_path
+from library_index import parse_audio_name
+from synthesis import JobManifest, segment_filename
+
+
+def book_file_of(book: str):
+    """分段文件名中的书名对应的 txt（相对 BOOKS_DIR），不存在时返回 None"""
+    name = book + '.txt'
+    return name if os.path.isfile(book_path(name)) else None
+
+
+def missing_ahead(library, book: str, voice: str, segment: int, ahead: int = None):
+    """当前分段之后 ahead 段中尚未合成的范围 (first, last)；都已合成或已到书尾时返回 None"""
+    ahead = config.PREFETCH_AHEAD if ahead is None else ahead
+    last = segment + ahead
+    missing = [s for s in range(segment + 1, last + 1) if segment_filename(book, voice, s) not in library]
+    if not missing:
+        return None
+    # 合成过程读到书尾时清单会登记分段总数，超出的部分不再提交
+    total = JobManifest(book, voice).data.get('total')
+    if total:
+        last = min(last, total)
+        missing = [s for s in missing if s <= last]
+    return (missing[0], last) if missing else None
+
+
+def ensure_ahead(library, book: str, voice: str, segment: int, username: str = '', conn=None):
+    """缺段时提交范围任务并返回任务号，不需要预合成或上次失败后仍在冷却时返回 None"""
+    if config.PREFETCH_AHEAD <= 0 or voice not in config.VOICE_OPTIONS:
+        return None
+    book_file = book_file_of(book)
+    missing = missing_ahead(library, book, voice, segment) if book_file else None
+    if not missing:
+        return None
+    if conn is not None:
+        return _submit(conn, book_file, voice, username, missing)
+    with closing(job_queue.connect()) as conn:
+        return _submit(conn, book_file, voice, username, missing)
+
+
+def _submit(conn, book_file: str, voice: str, username: str, missing):
+    if job_queue.retry_after(conn, book_file, voice, config.PREFETCH_RETRY_SECONDS,
+                             config.PREFETCH_RETRY_MAX_SECONDS) > 0:
+        return None
+    return job_queue.enqueue(conn, book_file, voice, username, segments=missing)
+
+
+def scan_records(conn, library) -> list[int]:
+    """最近 PREFETCH_ACTIVE_SECONDS 内有人在听的每本书各检查一次，返回提交的任务号
+
+    连续播放、后台标签页播放都不会触发 Streamlit rerun，但位置存档会写入播放记录，
+    worker 据此跟上收听进度
+    """
+    since = (datetime.now() - timedelta(seconds=config.PREFETCH_ACTIVE_SECONDS)).isoformat()
+    current = {}
+    for record in playback_store.recent_records(since):
+        if '/' in record['audio_file']:
+            continue  # 整章文件：分段已全部合成
+        entry = parse_audio_name(record['audio_file'])
+        if entry.voice:
+            # 记录按播放时间先后排列，留下每个 (用户, 书, 音色) 最后在听的分段
+            current[(record['username'], entry.book, entry.voice)] = entry.segment
+    jobs = []
+    for (username, book, voice), segment in current.items():
+        job_id = ensure_ahead(library, book, voice, segment, username, conn=conn)
+        if job_id:
+            jobs.append(job_id)
+    return jobs
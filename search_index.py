@@ -0,0 +1,204 @@
+"""全文搜索：Books 目录的字符 n-gram 倒排索引
+
+中文没有空格分词，按相邻字符的 n-gram（默认二元，config.SEARCH_NGRAM）建索引：
+每个 n-gram 记录一本书中包含它的分段号，分段与 iter_book_chunks（合成用的分段参数）一致，
+分段号即合成出的 {书}_{音色}_seg{NNN}.mp3。查询时对各 n-gram 的分段号求交集，
+再在候选分段的原文中确认短语、截取上下文。
+
+索引保存在 SQLite（config.SEARCH_DB）；refresh 只重建 mtime / 大小 / 分段参数变化了的书。
+"""
+import array
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+
+import config
+from book_reader import iter_book_chunks
+from synthesis import chunk_kwargs
+
+# 只对汉字 / 字母 / 数字建索引，标点与空白把文本切成若干段
+_WORD = re.compile(r'[\u4e00-\u9fa5a-z0-9]+')
+
+# offset：短语在分段文本中的字符位置；chars：分段总字符数（用于估算播放位置）
+SearchHit = namedtuple('SearchHit', 'book segment offset chars snippet')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id       INTEGER PRIMARY KEY,
+    name     TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size     INTEGER NOT NULL,
+    params   TEXT NOT NULL,
+    segments INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    book_id INTEGER NOT NULL,
+    seg     INTEGER NOT NULL,
+    text    TEXT NOT NULL,
+    PRIMARY KEY (book_id, seg)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS postings (
+    gram    TEXT NOT NULL,
+    book_id INTEGER NOT NULL,
+    segs    BLOB NOT NULL,
+    PRIMARY KEY (gram, book_id)
+) WITHOUT ROWID;
+"""
+
+_local = threading.local()
+_refresh_lock = threading.Lock()
+
+
+def _db() -> sqlite3.Connection:
+    """搜索索引库（WAL，每线程一个连接）"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(config.SEARCH_DB, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def ngrams(text: str, n: int = None) -> set[str]:
+    """文本中所有汉字 / 字母 / 数字连续片段的 n-gram（小写）"""
+    n = n or config.SEARCH_NGRAM
+    grams = set()
+    for run in _WORD.findall(text.lower()):
+        grams.update(run[i:i + n] for i in range(len(run) - n + 1))
+    return grams
+
+
+def _params() -> str:
+    """分段参数或 n 变化后分段号 / n-gram 都会变，需要重建"""
+    return json.dumps({**chunk_kwargs(), 'n': config.SEARCH_NGRAM}, sort_keys=True)
+
+
+def _drop_book(conn, book_id: int):
+    # 按旧分段文本算出的 n-gram 按主键删除倒排记录，不必给 postings 再建 book_id 索引
+    old = set()
+    for (text,) in conn.execute('SELECT text FROM chunks WHERE book_id = ?', (book_id,)):
+        old |= ngrams(text)
+    conn.executemany('DELETE FROM postings WHERE gram = ? AND book_id = ?', ((g, book_id) for g in old))
+    conn.execute('DELETE FROM chunks WHERE book_id = ?', (book_id,))
+
+
+def _index_book(conn, name: str, stat: os.stat_result, params: str):
+    # 先在事务外分段、统计，写库时只持有很短的写锁
+    chunks, postings = [], {}
+    for seg, text in enumerate(iter_book_chunks(name, **chunk_kwargs()), 1):
+        chunks.append((seg, text))
+        for gram in ngrams(text):
+            postings.setdefault(gram, []).append(seg)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT id FROM books WHERE name = ?', (name,)).fetchone()
+        if row:
+            book_id = row[0]
+            _drop_book(conn, book_id)
+            conn.execute('UPDATE books SET mtime_ns = ?, size = ?, params = ?, segments = ? WHERE id = ?',
+                         (stat.st_mtime_ns, stat.st_size, params, len(chunks), book_id))
+        else:
+            book_id = conn.execute(
+                'INSERT INTO books (name, mtime_ns, size, params, segments) VALUES (?, ?, ?, ?, ?)',
+                (name, stat.st_mtime_ns, stat.st_size, params, len(chunks))).lastrowid
+        conn.executemany('INSERT INTO chunks (book_id, seg, text) VALUES (?, ?, ?)',
+                         ((book_id, seg, text) for seg, text in chunks))
+        conn.executemany('INSERT INTO postings (gram, book_id, segs) VALUES (?, ?, ?)',
+                         ((g, book_id, array.array('I', segs).tobytes()) for g, segs in postings.items()))
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def refresh() -> dict:
+    """增量更新：只重建新增 / 修改过的书，删除已不存在的书；返回各类书的数量"""
+    stats = {'indexed': 0, 'removed': 0, 'unchanged': 0, 'failed': 0}
+    books = {}
+    if os.path.isdir(config.BOOKS_DIR):
+        with os.scandir(config.BOOKS_DIR) as it:
+            for e in it:
+                if e.name.endswith('.txt') and e.is_file():
+                    books[e.name] = e.stat()
+    params = _params()
+    with _refresh_lock:
+        conn = _db()
+        known = {name: (book_id, mtime_ns, size, p) for book_id, name, mtime_ns, size, p
+                 in conn.execute('SELECT id, name, mtime_ns, size, params FROM books')}
+        for name, (book_id, *_) in known.items():
+            if name not in books:
+                conn.execute('BEGIN IMMEDIATE')
+                _drop_book(conn, book_id)
+                conn.execute('DELETE FROM books WHERE id = ?', (book_id,))
+                conn.execute('COMMIT')
+                stats['removed'] += 1
+        for name, stat in sorted(books.items()):
+            if known.get(name, (None,))[1:] == (stat.st_mtime_ns, stat.st_size, params):
+                stats['unchanged'] += 1
+                continue
+            try:
+                _index_book(conn, name, stat, params)
+                stats['indexed'] += 1
+            except (OSError, UnicodeError) as e:
+                print(f"建立搜索索引失败 {name}: {e}")
+                stats['failed'] += 1
+    return stats
+
+
+def _snippet(text: str, offset: int, length: int, context: int = 30) -> str:
+    start, end = max(0, offset - context), offset + length + context
+    return ('…' if start else '') + text[start:end] + ('…' if end < len(text) else '')
+
+
+def search(query: str, limit: int = None) -> list[SearchHit]:
+    """查找包含 query 的分段，按书名、分段号排序，最多 limit 条"""
+    limit = limit or config.SEARCH_MAX_RESULTS
+    needle = query.strip().lower()
+    if not needle:
+        return []
+    conn = _db()
+    names = dict(conn.execute('SELECT id, name FROM books'))
+    grams = ngrams(needle)
+    if grams:
+        postings = []
+        for gram in grams:
+            rows = dict(conn.execute('SELECT book_id, segs FROM postings WHERE gram = ?', (gram,)))
+            if not rows:
+                return []
+            postings.append(rows)
+        # 先按书求交集，再逐本书按书名顺序展开分段号；凑满 limit 条即停止，后面的书不必解码
+        books = set.intersection(*(set(rows) for rows in postings))
+        hits = []
+        for book_id in sorted(books, key=names.get):
+            blobs = sorted((rows[book_id] for rows in postings), key=len)
+            segs = set(array.array('I', blobs[0]))
+            for blob in blobs[1:]:
+                segs &= set(array.array('I', blob))
+                if not segs:
+                    break
+            segs = sorted(segs)
+            # 分批取原文，不超过 SQLite 的参数个数上限
+            for i in range(0, len(segs), 500):
+                batch = segs[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                for seg, text in conn.execute(
+                        f'SELECT seg, text FROM chunks WHERE book_id = ? AND seg IN ({placeholders}) ORDER BY seg',
+                        (book_id, *batch)):
+                    offset = text.lower().find(needle)
+                    if offset >= 0:
+                        hits.append(SearchHit(names[book_id], seg, offset, len(text),
+                                              _snippet(text, offset, len(needle))))
+                        if len(hits) >= limit:
+                            return hits
+        return hits
+    # 查询里没有完整的 n-gram（如单个汉字）：直接扫描分段原文
+    hits = []
+    for book_id, seg, text in conn.execute(
+            'SELECT book_id, seg, text FROM chunks WHERE instr(lower(text), ?) > 0 LIMIT ?', (needle, limit)):
+        offset = text.lower().find(needle)
+        hits.append(SearchHit(names[book_id], seg, offset, len(text), _snippet(text, offset, len(needle))))
+    return sorted(hits, key=lambda h: (h.book, h.segment))
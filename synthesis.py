@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from datetime import datetime
+
+import config
+import mp3_scan
+from library_index import save_media_info
+from tts_backends import error_code
+
+try:
+    import fcntl
+except ImportError:  # Windows：只有进程内的锁
+    fcntl = None
+
+# 百度 TTS 中可重试的错误码：服务内部错误 / 请求或 QPS 超限 / 后端繁忙
+TRANSIENT_ERR_CODES = {2, 4, 18, 503, 282000}
+
+
+class SegmentError(Exception):
+    """单段合成失败（网络异常 / 错误字典 / 非法音频）"""
+    def __init__(self, idx: int, message: str, transient: bool = False):
+        super().__init__(message)
+        self.idx = idx
+        self.transient = transient
+
+
+def chunk_kwargs() -> dict:
+    """合成用的分段参数（split_text / iter_file_chunks 共用）"""
+    return {
+        'max_bytes': config.TTS_MAX_BYTES,
+        'pack': config.TTS_PACK_CHUNKS,
+        'encoding': config.TTS_BYTE_ENCODING,
+        'baseline_bytes': config.TTS_BASELINE_BYTES,
+    }
+
+
+def segment_filename(base_name: str, voice_name: str, idx: int) -> str:
+    return f"{base_name}_{voice_name}_seg{idx:03d}.mp3"
+
+
+def check_audio(idx: int, data: bytes) -> dict:
+    """逐帧检查 MP3 是否完整，返回 mp3_scan 的扫描结果（含时长）；不合法时抛 SegmentError"""
+    info = mp3_scan.scan_bytes(data)
+    if not info['valid']:
+        raise SegmentError(idx, f"第 {idx} 段不是合法 mp3（{info['error']}），前4字节={data[:4]} 长度={len(data)}")
+    return info
+
+
+def synthesize_segment(client, idx: int, seg: str, options: dict) -> bytes:
+    """合成单段，网络异常或返回错误字典时抛 SegmentError（音频本身由 check_audio 检查）"""
+    try:
+        result = client.synthesis(seg, 'zh', 1, options)
+    except Exception as e:
+        raise SegmentError(idx, f"第 {idx} 段网络异常：{e}", transient=True)
+    if isinstance(result, dict):
+        transient = error_code(result) in TRANSIENT_ERR_CODES
+        raise SegmentError(idx, f"第 {idx} 段合成失败：{result}", transient=transient)
+    return result
+
+
+def synthesize_with_retry(client, idx: int, seg: str, options: dict,
+                          retries: int = None, backoff: float = None) -> bytes:
+    """临时性失败按指数退避（带抖动）重试，永久性失败立即抛出"""
+    retries = config.TTS_RETRIES if retries is None else retries
+    backoff = config.TTS_BACKOFF_BASE if backoff is None else backoff
+    for attempt in range(retries + 1):
+        try:
+            return synthesize_segment(client, idx, seg, options)
+        except SegmentError as e:
+            if not e.transient or attempt == retries:
+                raise
+            delay = min(backoff * (2 ** attempt), config.TTS_BACKOFF_MAX)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+def write_segment(fpath: str, data: bytes):
+    """先写临时文件再原子替换，避免留下写了一半的 mp3
+
+    临时文件名由 mkstemp 生成，每个写入者各用各的，多个 worker 写同一分段时不会互相覆盖或删除
+    """
+    folder, name = os.path.split(fpath)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.part', dir=folder)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, fpath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class JobManifest:
+    """每个 (书, 音色) 一份合成清单，记录哪些分段已完成
+
+    清单中保存每段文本的摘要与合成参数：书被修改或参数变化的分段
+    会被视为未完成，其余分段在重试时直接跳过。
+    整个清单是一个 JSON 文件，每段都重写会使整本合成变成 O(n²)，
+    因此 mark_done 至多每 SAVE_INTERVAL 秒落盘一次，最后由 finish / flush 写全；
+    进程崩溃时最多丢失这一小段时间内的记录，重试时这些分段会命中 TTS 缓存。
+    落盘时在跨进程锁内重读磁盘上的清单并合并，其他进程同时写入的分段记录不会被覆盖。
+    """
+
+    SAVE_INTERVAL = 1.0
+
+    def __init__(self, base_name: str, voice_name: str, jobs_dir: str = None):
+        self.base_name = base_name
+        self.voice_name = voice_name
+        self.jobs_dir = jobs_dir or config.JOBS_DIR
+        self.path = os.path.join(self.jobs_dir, f"{base_name}_{voice_name}.json")
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = 0.0
+        self.data = self._load()
+
+    def _load(self) -> dict:
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {'book': self.base_name, 'voice': self.voice_name, 'segments': {}}
+
+    @contextmanager
+    def _file_lock(self):
+        """跨进程（flock）互斥，重读-合并-写回期间其他进程的写入者等待（调用方已持 self._lock）"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self, total: int = None):
+        """与磁盘上的清单合并后原子写回；total 不为空时丢弃越界的分段记录"""
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        with self._file_lock():
+            disk = self._load()
+            segments = {**disk.get('segments', {}), **self.data['segments']}
+            if total is not None:
+                segments = {k: v for k, v in segments.items() if int(k) <= total}
+            self.data = {**disk, **self.data, 'segments': segments,
+                         'updated_at': datetime.now().isoformat()}
+            fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(self.path)}.', suffix='.part',
+                                            dir=self.jobs_dir)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self.data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def flush(self):
+        """把尚未落盘的完成记录写入清单"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    @staticmethod
+    def digest(seg: str, options: dict) -> str:
+        payload = json.dumps({'text': seg, 'options': options}, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def finish(self, total: int):
+        """整本合成完成后登记分段总数，并丢弃越界的旧记录（书被删短时）"""
+        with self._lock:
+            self.data['total'] = total
+            self._save(total)
+
+    def is_done(self, idx: int, seg: str, options: dict, fpath: str) -> bool:
+        entry = self.data['segments'].get(str(idx))
+        return bool(entry) and entry['digest'] == self.digest(seg, options) and os.path.exists(fpath)
+
+    def mark_done(self, idx: int, seg: str, options: dict, fname: str):
+        with self._lock:
+            self.data['segments'][str(idx)] = {
+                'file': fname,
+                'digest': self.digest(seg, options),
+                'chars': len(seg),
+            }
+            self._dirty = True
+            if time.monotonic() - self._saved_at >= self.SAVE_INTERVAL:
+                self._save()
+
+
+def synthesize_book(chunks, voice_type: int, base_name: str, voice_name: str,
+                    client, cache=None, workers: int = None, on_progress=None, segments=None):
+    """
+    按清单断点续合成：已完成的分段跳过，其余并发合成并逐段记录检查点
+    chunks 可以是列表，也可以是 text_split.iter_file_chunks 这样的生成器——
+    边分段边提交，在途分段数不超过 2×workers，第 1 段不必等整本书解析完
+    on_progress(idx, total, seg, source) 在调用线程中回调，source 为 done/cache/api；
+    chunks 为生成器时 total 在结束前未知，传 None
+    segments=(first, last) 时只合成这一范围内的分段（含两端，按收听进度预合成用），
+    读到 last 即停止，不必分段整本书
+    返回 (List[文件名], 错误信息或 None)；失败时已完成的分段保留供下次续传
+    """
+    # 1=wav(带RIFF头)  3/4=裸pcm  6=mp3
+    options = {'spd': 5, 'pit': 5, 'vol': 5, 'per': voice_type, 'aue': 6}
+    os.makedirs(config.AUDIO_FILES_DIR, exist_ok=True)
+    manifest = JobManifest(base_name, voice_name)
+    total = len(chunks) if hasattr(chunks, '__len__') else None
+    first, last = segments or (1, None)
+    if segments:
+        total = last - first + 1
+    workers = max(1, workers or config.TTS_WORKERS)
+    files = []
+
+    def job(idx: int, seg: str, fname: str) -> tuple[int, str, str]:
+        result, source, key = None, 'api', None
+        if cache is not None:
+            key = cache.make_key(seg, options)
+            result = cache.get(key)
+            source = 'cache'
+        if result is None:
+            result = synthesize_with_retry(client, idx, seg, options)
+            source = 'api'
+        info = check_audio(idx, result)
+        if source == 'api' and key is not None:
+            cache.put(key, result)
+        fpath = os.path.join(config.AUDIO_FILES_DIR, fname)
+        write_segment(fpath, result)
+        # 合成时就登记时长，播放器与统计页不必再扫描文件
+        save_media_info(fname, info, os.stat(fpath))
+        manifest.mark_done(idx, seg, options, fname)
+        return idx, seg, source
+
+    def collect(finished):
+        for fut in finished:
+            idx, seg, source = fut.result()
+            if on_progress:
+                on_progress(idx, total, seg, source)
+
+    inflight = set()
+    read, book_total = 0, None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            try:
+                for idx, seg in enumerate(chunks, 1):
+                    read = idx
+                    if idx < first:
+                        continue
+                    if last is not None and idx > last:
+                        break
+                    fname = segment_filename(base_name, voice_name, idx)
+                    files.append(fname)
+                    if manifest.is_done(idx, seg, options, os.path.join(config.AUDIO_FILES_DIR, fname)):
+                        if on_progress:
+                            on_progress(idx, total, seg, 'done')
+                        continue
+                    inflight.add(pool.submit(job, idx, seg, fname))
+                    if len(inflight) >= workers * 2:
+                        finished, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                        collect(finished)
+                else:
+                    # 读到了书尾：整本的分段数已知（范围合成读到书尾时也登记，预合成据此停止）
+                    book_total = read
+                collect(as_completed(inflight))
+            except Exception as e:
+                for f in inflight:
+                    f.cancel()
+                return [], str(e)
+    finally:
+        # 出错或被中断时也保留已完成分段的记录（线程池退出后，运行中的分段都已登记）
+        manifest.flush()
+    if book_total is not None:
+        manifest.finish(book_total)
+    return files, None
@@ -0,0 +1,68 @@
+"""prefetch 预合成：范围任务失败后按指数退避，不会每次扫描都重新提交
+
+用法：python -m pytest tests
+"""
+import os
+import sys
+from contextlib import closing
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import job_queue  # noqa: E402
+import prefetch  # noqa: E402
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    books = tmp_path / 'Books'
+    books.mkdir()
+    (books / 'bk.txt').write_text('第一句。第二句。', encoding='utf-8')
+    monkeypatch.setattr(config, 'BOOKS_DIR', str(books))
+    monkeypatch.setattr(config, 'JOBS_DIR', str(tmp_path / 'jobs'))
+    monkeypatch.setattr(config, 'PREFETCH_AHEAD', 5)
+    monkeypatch.setattr(config, 'PREFETCH_RETRY_SECONDS', 60)
+    monkeypatch.setattr(config, 'PREFETCH_RETRY_MAX_SECONDS', 3600)
+    with closing(job_queue.connect(str(tmp_path / 'jobs.db'))) as conn:
+        yield conn
+
+
+def _fail(conn, job_id: int, ago: float = 0):
+    job = job_queue.claim_next(conn, 'w')
+    assert job['id'] == job_id
+    job_queue.finish(conn, job_id, '配额已用完')
+    conn.execute('UPDATE jobs SET heartbeat = heartbeat - ? WHERE id = ?', (ago, job_id))
+
+
+def test_failed_range_is_not_resubmitted_during_cooldown(conn):
+    first = prefetch.ensure_ahead(set(), 'bk', '女声', 1, 'u', conn=conn)
+    assert first
+    _fail(conn, first)
+    for _ in range(3):
+        assert prefetch.ensure_ahead(set(), 'bk', '女声', 1, 'u', conn=conn) is None
+    assert len(job_queue.list_jobs(conn)) == 1
+
+
+def test_cooldown_doubles_with_consecutive_failures(conn):
+    job_id = prefetch.ensure_ahead(set(), 'bk', '女声', 1, 'u', conn=conn)
+    _fail(conn, job_id, ago=61)
+    # 冷却 60 秒已过：再提交一次
+    job_id = prefetch.ensure_ahead(set(), 'bk', '女声', 1, 'u', conn=conn)
+    assert job_id
+    _fail(conn, job_id, ago=61)
+    # 连续两次失败：冷却 120 秒
+    assert prefetch.ensure_ahead(set(), 'bk', '女声', 1, 'u', conn=conn) is None
+    assert 0 < job_queue.retry_after(conn, 'bk.txt', '女声', 60, 3600) <= 60
+    conn.execute('UPDATE jobs SET heartbeat = heartbeat - 60 WHERE id = ?', (job_id,))
+    assert prefetch.ensure_ahead(set(), 'bk', '女声', 1, 'u', conn=conn)
+
+
+def test_success_resets_backoff(conn):
+    job_id = prefetch.ensure_ahead(set(), 'bk', '女声', 1, 'u', conn=conn)
+    _fail(conn, job_id, ago=61)
+    job_id = prefetch.ensure_ahead(set(), 'bk', '女声', 1, 'u', conn=conn)
+    job_queue.claim_next(conn, 'w')
+    job_queue.finish(conn, job_id)
+    assert job_queue.retry_after(conn, 'bk.txt', '女声', 60, 3600) == 0
@@ -0,0 +1,44 @@
+"""text_split 装箱模式：成串的分句标点不能单独成段
+
+用法：python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_split import _HAS_CONTENT, _split_at_clause, byte_len, split_text  # noqa: E402
+
+CASES = [
+    ('啊' * 20 + '，？', 30),
+    ('甲' * 30 + '？', 30),
+    ('你好' * 8 + '，' * 5 + '世界' * 8 + '。', 30),
+    ('，' * 40 + '内容在这里。', 30),
+    ('内容' * 10 + '，' * 20, 30),
+    ('前。甲乙丙丁，？', 22),
+    ('前。，，甲乙丙丁，后', 22),
+    ('一句话，，，，，另一句话；；；；；' * 6 + '结尾？！', 40),
+]
+
+
+@pytest.mark.parametrize('text, max_bytes', CASES)
+def test_pack_never_emits_punctuation_only_chunks(text, max_bytes):
+    chunks = split_text(text, max_bytes, pack=True)
+    assert chunks
+    for chunk in chunks:
+        assert _HAS_CONTENT.search(chunk), chunks
+        assert byte_len(chunk) <= max_bytes, chunks
+
+
+def test_pack_keeps_trailing_question_mark_with_speech():
+    chunks = split_text('甲' * 30 + '？', 30, pack=True)
+    assert chunks[-1] == '甲？'
+    assert ''.join(chunks) == '甲' * 30 + '？'
+
+
+def test_split_at_clause_does_not_leave_bare_tail():
+    assert _split_at_clause('甲乙丙丁，？', 16, 'utf-8') == ('', '甲乙丙丁，？')
+    assert _split_at_clause('，，甲乙丙丁，后', 21, 'utf-8') == ('，，甲乙丙丁，', '后')
+    assert _split_at_clause('，，甲乙丙丁，后', 6, 'utf-8') == ('', '，，甲乙丙丁，后')
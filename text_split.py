@@ -0,0 +1,275 @@
+import io
+import re
+
+# 句末标点：每个“句子”是一串非句末字符加上至多一个句末标点
+_SENTENCE_END = re.compile(r'[。！？\.\?\!]')
+# 至少含一个汉字 / 字母 / 数字的句子才有合成意义
+_HAS_CONTENT = re.compile(r'[\u4e00-\u9fa5a-zA-Z0-9]')
+
+# 分句点：超长句子优先在这里拆开
+_CLAUSE_END = re.compile(r'[，；、,;]')
+_CLAUSES = re.compile(r'[^，；、,;]*[，；、,;]?')
+
+READ_SIZE = 64 * 1024
+
+
+def utf8_len(s: str) -> int:
+    """UTF-8 字节数；纯 ASCII 时不必编码"""
+    return len(s) if s.isascii() else len(s.encode('utf-8'))
+
+
+def byte_len(s: str, encoding: str = 'utf-8') -> int:
+    """按接口计长所用的编码计算字节数（百度 TTS 按 GBK 计长）"""
+    if encoding == 'utf-8' or s.isascii():
+        return utf8_len(s)
+    return len(s.encode(encoding, errors='replace'))
+
+
+def iter_sentences(stream, read_size: int = READ_SIZE):
+    """从文本流中逐块读取并按句末标点切句（未去空白、未过滤）
+
+    跨块的半句只保存在 carry 里，内存占用与最长句子而非整本书成正比。
+    """
+    carry = []
+    first = True
+    while True:
+        block = stream.read(read_size)
+        if not block:
+            break
+        if first:
+            block = block.lstrip('\ufeff')
+            if not block:
+                continue
+            first = False
+        start = 0
+        for m in _SENTENCE_END.finditer(block):
+            if carry:
+                carry.append(block[start:m.end()])
+                yield ''.join(carry)
+                carry = []
+            else:
+                yield block[start:m.end()]
+            start = m.end()
+        if start < len(block):
+            carry.append(block[start:])
+    if carry:
+        yield ''.join(carry)
+
+
+def _hard_split(text: str, max_bytes: int, encoding: str) -> list[str]:
+    """按字符硬切，每片不超过 max_bytes"""
+    pieces, start, size = [], 0, 0
+    for i, ch in enumerate(text):
+        l = byte_len(ch, encoding)
+        if size + l > max_bytes and i > start:
+            pieces.append(text[start:i])
+            start, size = i, 0
+        size += l
+    pieces.append(text[start:])
+    return pieces
+
+
+def fit_sentence(sent: str, max_bytes: int, encoding: str = 'utf-8') -> list[str]:
+    """超长句子先按 ，；、 等分句点拆开重新装箱，单个分句仍超长再按字符硬切"""
+    if byte_len(sent, encoding) <= max_bytes:
+        return [sent]
+    pieces, parts, size = [], [], 0
+    for clause in _CLAUSES.findall(sent):
+        if not clause:
+            continue
+        l = byte_len(clause, encoding)
+        if l > max_bytes:
+            if parts:
+                pieces.append(''.join(parts))
+                parts, size = [], 0
+            pieces.extend(_hard_split(clause, max_bytes, encoding))
+        elif size + l <= max_bytes:
+            parts.append(clause)
+            size += l
+        else:
+            pieces.append(''.join(parts))
+            parts, size = [clause], l
+    if parts:
+        pieces.append(''.join(parts))
+    return _merge_bare(pieces, max_bytes, encoding)
+
+
+def _clip(s: str, room: int, encoding: str, tail: bool = False) -> str:
+    """s 不超过 room 字节的最长前缀（tail=True 时为后缀）"""
+    size, n = 0, 0
+    for ch in (reversed(s) if tail else s):
+        size += byte_len(ch, encoding)
+        if size > room:
+            break
+        n += 1
+    return s[len(s) - n:] if tail else s[:n]
+
+
+def _merge_bare(pieces: list[str], max_bytes: int, encoding: str) -> list[str]:
+    """不含汉字 / 字母 / 数字的片段（如 '？'、'，，，，，'）不单独成段，并入相邻片段
+
+    中间与末尾的并入前一片段；前一片段已满时从它末尾挪一个字过来，与标点组成新片段；
+    开头的并入后一片段。放不下 max_bytes 的多余标点不影响朗读，直接丢弃
+    """
+    out, lead = [], ''
+    for piece in pieces:
+        if _HAS_CONTENT.search(piece):
+            if lead:
+                piece = _clip(lead, max_bytes - byte_len(piece, encoding), encoding, tail=True) + piece
+                lead = ''
+            out.append(piece)
+            continue
+        if not out:
+            lead += piece
+            continue
+        prev = out[-1]
+        room = max_bytes - byte_len(prev, encoding)
+        head = _clip(piece, room, encoding)
+        if head or not _HAS_CONTENT.match(prev[-1]) or not _HAS_CONTENT.search(prev[:-1]):
+            out[-1] = prev + head
+        else:
+            out[-1] = prev[:-1]
+            out.append(prev[-1] + _clip(piece, max_bytes - byte_len(prev[-1], encoding), encoding))
+    return out
+
+
+def _split_at_clause(sent: str, room: int, encoding: str):
+    """在不超过 room 字节的最后一个分句点处切开，返回 (头, 尾)；放不下任何分句时头为空
+
+    只在头、尾都含有汉字 / 字母 / 数字的位置切开，不切出只有标点的半句
+    """
+    words = [m.start() for m in _HAS_CONTENT.finditer(sent)]
+    if not words:
+        return '', sent
+    cut, size, start = 0, 0, 0
+    for m in _CLAUSE_END.finditer(sent):
+        size += byte_len(sent[start:m.end()], encoding)
+        start = m.end()
+        if size > room or m.end() > words[-1]:
+            break
+        if m.end() > words[0]:
+            cut = m.end()
+    return sent[:cut], sent[cut:]
+
+
+def _iter_whole_sentences(stream, max_bytes: int, read_size: int, encoding: str):
+    """默认路径（不拆句、不统计）：整句装箱，循环里没有 pack / stats 的分支"""
+    size = utf8_len if encoding == 'utf-8' else lambda s: byte_len(s, encoding)
+    parts, buf_len = [], 0
+    for sent in iter_sentences(stream, read_size):
+        sent = sent.strip()
+        if not sent or not _HAS_CONTENT.search(sent):
+            continue
+        l = size(sent)
+        if buf_len + l <= max_bytes:
+            parts.append(sent)
+            buf_len += l
+        else:
+            if parts:
+                yield ''.join(parts)
+            parts, buf_len = [sent], l
+    if parts:
+        yield ''.join(parts)
+
+
+def iter_chunks(stream, max_bytes: int = 1800, read_size: int = READ_SIZE,
+                pack: bool = False, encoding: str = 'utf-8', stats: dict = None,
+                baseline_bytes: int = None):
+    """流式分段：边读边按 max_bytes 把句子装箱，装满一段就 yield
+
+    默认与 split_text 的分段结果一致，但不需要先把整本书读进内存。
+    pack=True 时尽量把每段填满：超长句子按分句点 / 字符拆开，
+    放不下的下一句在分句点处切开，前半句补进当前段。
+    传入 stats 字典时累计 chunks / bytes / baseline_chunks / oversized，
+    baseline_chunks 为旧分段方式（整句、按 UTF-8 计长、上限 baseline_bytes，
+    默认同 max_bytes）所需的请求数，见 pack_report。
+    """
+    if not pack and stats is None:
+        yield from _iter_whole_sentences(stream, max_bytes, read_size, encoding)
+        return
+    baseline_bytes = baseline_bytes or max_bytes
+    if stats is not None:
+        for k in ('chunks', 'bytes', 'baseline_chunks', 'oversized', 'split_sentences'):
+            stats.setdefault(k, 0)
+    parts, buf_len, base_len = [], 0, 0
+
+    def emit():
+        if stats is not None:
+            stats['chunks'] += 1
+            stats['bytes'] += buf_len
+        return ''.join(parts)
+
+    for sent in iter_sentences(stream, read_size):
+        sent = sent.strip()
+        if not sent or not _HAS_CONTENT.search(sent):
+            continue
+        l = byte_len(sent, encoding)
+        if stats is not None:
+            # 对照：旧分段方式的请求数
+            base_l = l if encoding == 'utf-8' else utf8_len(sent)
+            if base_len + base_l <= baseline_bytes:
+                base_len += base_l
+            else:
+                stats['baseline_chunks'] += base_len > 0
+                base_len = base_l
+            if l > max_bytes:
+                stats['oversized'] += 1
+        pieces = [sent]
+        if pack and l > max_bytes:
+            pieces = fit_sentence(sent, max_bytes, encoding)
+            if stats is not None:
+                stats['split_sentences'] += 1
+        for piece in pieces:
+            l = byte_len(piece, encoding) if len(pieces) > 1 else l
+            if buf_len + l <= max_bytes:
+                parts.append(piece)
+                buf_len += l
+                continue
+            if pack and parts:
+                head, piece = _split_at_clause(piece, max_bytes - buf_len, encoding)
+                if head:
+                    parts.append(head)
+                    buf_len += byte_len(head, encoding)
+                    l = byte_len(piece, encoding)
+                    if stats is not None:
+                        stats['split_sentences'] += 1
+            if parts:
+                yield emit()
+            parts, buf_len = [piece], l
+    if stats is not None:
+        stats['baseline_chunks'] += base_len > 0
+    if parts:
+        yield emit()
+
+
+def pack_report(stats: dict, max_bytes: int) -> dict:
+    """由 iter_chunks 累计的 stats 计算相对旧分段方式节省的请求数与平均填充率"""
+    chunks = stats.get('chunks', 0)
+    baseline = stats.get('baseline_chunks', 0)
+    return {
+        'requests': chunks,
+        'baseline_requests': baseline,
+        'saved_requests': baseline - chunks,
+        'oversized_sentences': stats.get('oversized', 0),
+        'fill_ratio': stats.get('bytes', 0) / (chunks * max_bytes) if chunks else 0.0,
+    }
+
+
+def iter_file_chunks(path: str, max_bytes: int = 1800, file_encoding: str = 'utf-8', **kwargs):
+    """逐块读取文本文件并 yield 分段，合成可以在整本书解析完之前开始
+
+    其余参数（pack / encoding / stats / baseline_bytes）透传给 iter_chunks
+    """
+    with open(path, 'r', encoding=file_encoding) as f:
+        yield from iter_chunks(f, max_bytes, **kwargs)
+
+
+def split_text(text: str, max_bytes: int = 1800, pack: bool = False,
+               encoding: str = 'utf-8', stats: dict = None, baseline_bytes: int = None) -> list[str]:
+    chunks = list(iter_chunks(io.StringIO(text), max_bytes, pack=pack, encoding=encoding,
+                              stats=stats, baseline_bytes=baseline_bytes))
+    if not chunks:
+        # 没有任何有效句子时，整段足够短就原样返回
+        text = text.lstrip('\ufeff').strip()
+        return [text] if text and byte_len(text, encoding) <= max_bytes else []
+    return chunks
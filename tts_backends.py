@@ -0,0 +1,202 @@
+"""合成后端：synthesis.synthesize_book 只依赖百度 SDK 的接口形状
+
+    client.synthesis(text, lang, ctype, options) -> MP3 bytes，失败时返回错误字典
+
+满足这个接口的对象都可以作为后端。FakeTTS 在本地模拟延迟、错误字典与 MP3 数据，
+不需要网络和凭证，用于离线压测（benchmarks/bench_suite.py）与开发调试。
+CredentialPool 把多个账号的客户端组合成一个后端：每个账号一个令牌桶，
+被限流时按 AIMD 降速，请求总是交给余量最多的账号。
+"""
+import random
+import threading
+import time
+from collections import deque
+
+import config
+
+# 通用错误码：4 集群超限 / 18 QPS 超限（限流，降速后重试）；17 日配额 / 19 总配额用完
+THROTTLE_ERR_CODES = {4, 18}
+QUOTA_ERR_CODES = {17, 19}
+
+# MPEG-2 Layer III、24kHz、48kbps、单声道的帧头；每帧 144 字节、24 毫秒
+_FRAME = bytes([0xFF, 0xF3, 0x64, 0xC4]) + bytes(140)
+
+
+class FakeTTS:
+    """本地模拟的 TTS 服务
+
+    latency / jitter：每次请求的耗时（秒），sleep 期间释放 GIL，与真实网络等待一致
+    error_rate：返回错误字典的概率，错误码从 error_codes 中随机选取
+    （默认 4/18 为 QPS 超限，属于可重试错误）
+    frames_per_char：每个字输出的帧数，默认 8 帧约 0.2 秒，接近真实朗读速度
+    qps_limit：模拟账号的 QPS 上限，最近 1 秒内的请求超过它时返回错误码 18
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_codes=(4, 18), frames_per_char: int = 8, seed: int = None,
+                 qps_limit: float = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.frames_per_char = frames_per_char
+        self._random = random.Random(seed)
+        self.qps_limit = qps_limit
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def synthesis(self, text, lang='zh', ctype=1, options=None):
+        with self._lock:
+            self.calls += 1
+            if self.qps_limit:
+                now = time.monotonic()
+                while self._recent and now - self._recent[0] >= 1.0:
+                    self._recent.popleft()
+                if len(self._recent) >= self.qps_limit:
+                    self.throttled += 1
+                    return {'error_code': 18, 'error_msg': 'Open api qps request limit reached'}
+                self._recent.append(now)
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+            failed = self._random.random() < self.error_rate
+            code = self._random.choice(self.error_codes) if failed else None
+            if failed:
+                self.errors += 1
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            return {'err_no': code, 'err_msg': 'fake tts error', 'err_subcode': 0, 'tts_logid': self.calls}
+        return _FRAME * max(1, len(text) * self.frames_per_char)
+
+
+def error_code(result: dict):
+    """兼容 err_no（语音合成）与 error_code（通用鉴权）两种错误字典"""
+    return result.get('err_no', result.get('error_code'))
+
+
+class _Credential:
+    """凭证池中的一个账号：令牌桶（速率按 AIMD 调整）与统计"""
+
+    def __init__(self, name: str, client, qps: float):
+        self.name = name
+        self.client = client
+        self.max_rate = qps
+        self.rate = qps
+        # 不攒突发：服务端按秒计数，突发加上匀速补充会在同一秒内超限
+        self.capacity = 1.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.decreased_at = 0.0
+        self.disabled_until = 0.0
+        self.calls = 0
+        self.throttled = 0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class CredentialPool:
+    """多账号合成后端，接口与 AipSpeech.synthesis 相同
+
+    - 每个账号一个令牌桶，请求交给当前令牌最多（余量最大）的账号，都没有令牌时等待
+    - 被限流（THROTTLE_ERR_CODES）：该账号速率减半、清空令牌，换一个账号立即重试；
+      每次成功速率增加 increase，直到配置的 QPS 上限（AIMD）
+    - 日配额用完（QUOTA_ERR_CODES）：该账号暂停 quota_cooldown 秒；全部暂停时返回错误字典
+    """
+
+    MIN_RATE = 0.2
+
+    def __init__(self, clients, increase: float = None, decrease: float = None,
+                 quota_cooldown: float = None):
+        """clients：[(名称, 客户端, QPS)]"""
+        self._creds = [_Credential(name, client, qps) for name, client, qps in clients]
+        if not self._creds:
+            raise ValueError("凭证池为空")
+        self.increase = config.TTS_AIMD_INCREASE if increase is None else increase
+        self.decrease = config.TTS_AIMD_DECREASE if decrease is None else decrease
+        self.quota_cooldown = config.TTS_QUOTA_COOLDOWN if quota_cooldown is None else quota_cooldown
+        self._cond = threading.Condition()
+
+    def _acquire(self):
+        """取一个令牌，返回 (账号, 发出时间)；所有账号都因配额暂停时返回 (None, None)"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                active = [c for c in self._creds if c.disabled_until <= now]
+                if not active:
+                    return None, None
+                for cred in active:
+                    cred.refill(now)
+                best = max(active, key=lambda c: c.tokens)
+                if best.tokens >= 1:
+                    best.tokens -= 1
+                    best.calls += 1
+                    return best, now
+                self._cond.wait(min((1 - c.tokens) / c.rate for c in active))
+
+    def _on_success(self, cred: _Credential):
+        with self._cond:
+            cred.rate = min(cred.max_rate, cred.rate + self.increase)
+
+    def _on_throttled(self, cred: _Credential, sent_at: float):
+        with self._cond:
+            cred.throttled += 1
+            # 降速前已发出的请求随后也会被限流，同一轮只减速一次
+            if sent_at < cred.decreased_at:
+                return
+            cred.rate = max(self.MIN_RATE, cred.rate * self.decrease)
+            cred.tokens = 0.0
+            cred.decreased_at = time.monotonic()
+
+    def _on_quota(self, cred: _Credential):
+        with self._cond:
+            cred.disabled_until = time.monotonic() + self.quota_cooldown
+            self._cond.notify_all()
+
+    def synthesis(self, text, lang='zh', ctype=1, options=None):
+        result = {'error_code': 17, 'error_msg': '凭证池中所有账号的配额均已用完'}
+        for _ in range(len(self._creds) * 2):
+            cred, sent_at = self._acquire()
+            if cred is None:
+                return result
+            result = cred.client.synthesis(text, lang, ctype, options)
+            if not isinstance(result, dict):
+                self._on_success(cred)
+                return result
+            code = error_code(result)
+            if code in THROTTLE_ERR_CODES:
+                self._on_throttled(cred, sent_at)
+            elif code in QUOTA_ERR_CODES:
+                self._on_quota(cred)
+            else:
+                return result
+        # 所有账号都在限流：交给 synthesize_with_retry 退避后再试
+        return result
+
+    def stats(self) -> list[dict]:
+        with self._cond:
+            now = time.monotonic()
+            return [{'name': c.name, 'rate': round(c.rate, 2), 'max_rate': c.max_rate, 'calls': c.calls,
+                     'throttled': c.throttled, 'paused': c.disabled_until > now} for c in self._creds]
+
+
+def make_client(backend: str = None):
+    """按 config.TTS_BACKEND 创建合成后端：baidu（默认，凭证池）/ fake"""
+    backend = backend or config.TTS_BACKEND
+    if backend == 'baidu':
+        # 百度 SDK 只在真正合成时导入
+        from aip import AipSpeech
+        credentials = config.TTS_CREDENTIALS or [
+            {'app_id': config.APP_ID, 'api_key': config.API_KEY, 'secret_key': config.SECRET_KEY}
+        ]
+        return CredentialPool([
+            (c['app_id'], AipSpeech(c['app_id'], c['api_key'], c['secret_key']),
+             c.get('qps', config.TTS_DEFAULT_QPS))
+            for c in credentials
+        ])
+    if backend == 'fake':
+        return FakeTTS(**config.FAKE_TTS_OPTIONS)
+    raise ValueError(f"未知的合成后端：{backend}")
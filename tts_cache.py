@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import threading
+
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows：只有进程内的锁
+    fcntl = None
+
+
+class TTSCache:
+    """按内容寻址的 TTS 音频缓存：键 = sha256(分段文本 + 合成参数)
+
+    音频按键名落盘，文件 mtime 充当最近使用时间；总大小超过 max_bytes 时
+    按 LRU 淘汰最久未用的条目，一直淘汰到 max_bytes × LOW_WATER。
+    多个进程（多个 worker、批量合成的进程池）可以共用同一目录：_size 只是本进程
+    在两次扫描之间的估计，淘汰时以扫描目录得到的实际总大小为准。
+    """
+
+    LOW_WATER = 0.9
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or config.TTS_CACHE_DIR
+        self.max_bytes = config.TTS_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    @staticmethod
+    def make_key(text: str, options: dict) -> str:
+        """同一段文本 + 同一组 per/spd/pit/vol/aue 得到同一个键"""
+        payload = json.dumps({'text': text, 'options': options}, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + '.mp3')
+
+    def _entries(self):
+        """[(路径, mtime, 大小)]，跳过写入中的临时文件"""
+        entries = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith('.mp3'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def get(self, key: str):
+        """命中返回音频 bytes 并刷新使用时间，未命中返回 None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        """写入缓存（原子替换），随后按预算淘汰"""
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.part"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self._size += len(data) - old_size
+            full = self._size > self.max_bytes
+        if full:
+            self._evict()
+
+    def _evict(self):
+        """扫描目录得到实际总大小（含其他进程写入的），按 mtime 从旧到新删除到低水位
+
+        扫描不持 self._lock，不阻塞其他线程的读写；已有线程 / 进程在淘汰时直接返回，
+        否则几个进程按同一份扫描结果各删一遍，会删到远低于预算
+        """
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        lock_file = None
+        try:
+            if fcntl is not None:
+                lock_file = open(os.path.join(self.cache_dir, '.evict.lock'), 'a')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return
+            entries = self._entries()
+            total = sum(size for _, _, size in entries)
+            target = self.max_bytes * self.LOW_WATER
+            evicted = 0
+            if total > self.max_bytes:
+                for path, _, size in sorted(entries, key=lambda e: e[1]):
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except OSError:  # 已被其他进程淘汰
+                        continue
+                    total -= size
+                    evicted += 1
+            with self._lock:
+                # 扫描期间本进程新写入的条目下次扫描时计入
+                self._size = total
+                self.evictions += evicted
+        finally:
+            if lock_file is not None:
+                lock_file.close()  # 关闭即释放 flock
+            self._evict_lock.release()
+
+    def stats(self) -> dict:
+        """命中 / 未命中 / 淘汰计数与当前占用"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
@@ -1,8 +1,23 @@
-import json
+import base64
+import copy
 import hashlib
+import hmac
+import json
 import os
+import secrets
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows：只有进程内的锁
+    fcntl = None
+
 # 用户配置文件路径
 USER_CONFIG_FILE = 'user_config.json'
 
@@ -17,27 +32,89 @@ DEFAULT_USERS = {
     }
 }
 
+# 内存中的用户表：文件 (mtime, size) 不变时不再重新解析
+_cache = {'stamp': None, 'users': None}
+_lock = threading.RLock()
+
+
+def _stamp():
+    try:
+        stat = os.stat(USER_CONFIG_FILE)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _users():
+    """缓存的用户表（只读，修改请走 _modify）"""
+    stamp = _stamp()
+    with _lock:
+        if _cache['users'] is None or stamp != _cache['stamp']:
+            try:
+                with open(USER_CONFIG_FILE, 'r', encoding='utf-8') as f:
+                    _cache['users'] = json.load(f)
+                _cache['stamp'] = stamp
+            except Exception as e:
+                print(f"加载用户配置失败: {e}")
+                return DEFAULT_USERS
+        return _cache['users']
+
+
+@contextmanager
+def _file_lock():
+    """进程内 + 跨进程（flock）互斥，读-改-写期间其他写入者等待"""
+    with _lock:
+        if fcntl is None:
+            yield
+            return
+        with open(USER_CONFIG_FILE + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write(users_config):
+    """写临时文件再 os.replace：读者只会看到旧文件或完整的新文件"""
+    folder = os.path.dirname(os.path.abspath(USER_CONFIG_FILE))
+    fd, tmp_path = tempfile.mkstemp(prefix='.user_config.', suffix='.part', dir=folder)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(users_config, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, USER_CONFIG_FILE)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    _cache['users'], _cache['stamp'] = users_config, _stamp()
+
+
+@contextmanager
+def _modify():
+    """在锁内取出最新用户表的副本，退出时原子写回"""
+    with _file_lock():
+        _cache['stamp'] = None  # 强制重读，拿到其他进程刚写入的内容
+        users = copy.deepcopy(_users())
+        yield users
+        _write(users)
+
+
 def init_user_config():
     """初始化用户配置文件"""
-    if not os.path.exists(USER_CONFIG_FILE):
-        save_user_config(DEFAULT_USERS)
-        return DEFAULT_USERS
+    with _file_lock():
+        if not os.path.exists(USER_CONFIG_FILE):
+            _write(copy.deepcopy(DEFAULT_USERS))
     return load_user_config()
 
 def load_user_config():
-    """加载用户配置"""
-    try:
-        with open(USER_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"加载用户配置失败: {e}")
-        return DEFAULT_USERS
+    """加载用户配置（返回副本，修改后用 save_user_config 保存）"""
+    return copy.deepcopy(_users())
 
 def save_user_config(users_config):
     """保存用户配置"""
     try:
-        with open(USER_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(users_config, f, ensure_ascii=False, indent=2)
+        with _file_lock():
+            _write(copy.deepcopy(users_config))
         return True
     except Exception as e:
         print(f"保存用户配置失败: {e}")
@@ -49,23 +126,27 @@ def hash_password(password):
 
 def verify_user(username, password):
     """验证用户名和密码"""
-    users = load_user_config()
+    users = _users()
     if username in users and users[username]['is_active']:
         return users[username]['password_hash'] == hash_password(password)
     return False
 
 def update_user_password(username, new_password):
     """更新用户密码"""
-    users = load_user_config()
-    if username in users:
-        users[username]['password_hash'] = hash_password(new_password)
-        users[username]['last_password_change'] = datetime.now().isoformat()
-        return save_user_config(users)
-    return False
+    try:
+        with _modify() as users:
+            if username not in users:
+                return False
+            users[username]['password_hash'] = hash_password(new_password)
+            users[username]['last_password_change'] = datetime.now().isoformat()
+        return True
+    except Exception as e:
+        print(f"保存用户配置失败: {e}")
+        return False
 
 def get_user_info(username):
     """获取用户信息"""
-    users = load_user_config()
+    users = _users()
     if username in users:
         user_info = users[username].copy()
         # 不返回密码哈希值
@@ -75,7 +156,61 @@ def get_user_info(username):
 
 def update_last_login(username):
     """更新用户最后登录时间"""
-    users = load_user_config()
-    if username in users:
-        users[username]['last_login'] = datetime.now().isoformat()
-        save_user_config(users)
+    try:
+        with _modify() as users:
+            if username in users:
+                users[username]['last_login'] = datetime.now().isoformat()
+    except Exception as e:
+        print(f"保存用户配置失败: {e}")
+
+
+# ---------- 会话令牌 ----------
+# 登录后签发，之后的 rerun 只验签，不再读用户文件；
+# 多副本部署时各实例配置同一个 QRADIO_SESSION_SECRET 即可互认
+
+def session_secret() -> bytes:
+    """签名密钥：优先取环境变量，否则使用（首次时生成的）本地密钥文件"""
+    if config.SESSION_SECRET:
+        return config.SESSION_SECRET.encode('utf-8')
+    with _lock:
+        if _cache.get('secret') is None:
+            try:
+                # O_EXCL：多个进程同时首次启动时只有一个能创建成功，其余读取它写入的密钥
+                fd = os.open(config.SESSION_SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(secrets.token_hex(32).encode('ascii'))
+            except FileExistsError:
+                pass
+            with open(config.SESSION_SECRET_FILE, 'rb') as f:
+                _cache['secret'] = f.read().strip()
+        return _cache['secret']
+
+
+def _sign(payload: bytes) -> str:
+    return hmac.new(session_secret(), payload, hashlib.sha256).hexdigest()
+
+
+def issue_session_token(username):
+    """签发会话令牌：内含侧边栏需要的角色与最后登录时间，以及过期时间"""
+    info = get_user_info(username) or {}
+    payload = json.dumps({
+        'user': username,
+        'role': info.get('role', 'user'),
+        'last_login': info.get('last_login'),
+        'exp': int(time.time()) + config.SESSION_TTL_SECONDS,
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    body = base64.urlsafe_b64encode(payload).decode('ascii')
+    return f"{body}.{_sign(payload)}"
+
+
+def verify_session_token(token):
+    """令牌有效时返回其中的用户信息 dict（user / role / last_login / exp），否则返回 None"""
+    body, _, sig = (token or '').partition('.')
+    try:
+        payload = base64.urlsafe_b64decode(body.encode('ascii'))
+        if not hmac.compare_digest(sig, _sign(payload)):
+            return None
+        claims = json.loads(payload)
+    except (ValueError, TypeError, UnicodeError):
+        return None
+    return claims if claims.get('exp', 0) > time.time() else None
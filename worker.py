@@ -0,0 +1,119 @@
+"""后台合成进程：从任务队列领取任务并合成，与 Streamlit 会话解耦
+
+用法：python worker.py          # 可同时启动多个进程并行消费
+"""
+import os
+import threading
+import time
+
+import chapters
+import config
+import job_queue
+import prefetch
+from book_reader import iter_book_chunks
+from library_index import LibraryIndex
+from synthesis import chunk_kwargs, synthesize_book
+from text_split import pack_report
+from tts_backends import make_client
+from tts_cache import TTSCache
+
+
+def _heartbeat_loop(name: str, current: dict, stop: threading.Event):
+    """独立线程定期刷新心跳，单段重试等待期间任务也不会被判定为失联"""
+    conn = job_queue.connect()
+    while not stop.wait(config.WORKER_HEARTBEAT_SECONDS):
+        job_queue.beat(conn, name)
+        if current.get('id'):
+            job_queue.touch(conn, current['id'])
+    conn.close()
+
+
+def run_job(conn, job: dict, client, cache):
+    voice_name = job['voice_name']
+    voice_type = config.VOICE_OPTIONS[voice_name]
+    base_name = os.path.splitext(job['book_file'])[0]
+    # 流式分段：边读书边提交合成，第 1 段不必等整本书解析完
+    stats = {}
+    chunks = iter_book_chunks(job['book_file'], stats=stats, **chunk_kwargs())
+
+    done = 0
+
+    def on_progress(idx, total, seg, source):
+        nonlocal done
+        done += 1
+        job_queue.update_progress(conn, job['id'], done, total or 0)
+
+    # 预合成任务只合成一个分段范围；读到书尾时范围内可能没有分段，不算失败
+    segments = (job['first_seg'], job['last_seg']) if job['first_seg'] else None
+    files, error = synthesize_book(chunks, voice_type, base_name, voice_name,
+                                   client=client, cache=cache, on_progress=on_progress, segments=segments)
+    if segments:
+        if not error:
+            job_queue.update_progress(conn, job['id'], len(files), len(files))
+        return error
+    if not error and not files:
+        return "拆分后没有有效段落！"
+    if not error:
+        job_queue.update_progress(conn, job['id'], len(files), len(files))
+        report = pack_report(stats, config.TTS_MAX_BYTES)
+        print(f"  {report['requests']} 段，比整句分段少 {report['saved_requests']} 次请求，"
+              f"平均填充率 {report['fill_ratio']:.0%}")
+        if hasattr(client, 'stats'):
+            for c in client.stats():
+                print(f"  凭证 {c['name']}：{c['calls']} 次请求，限流 {c['throttled']} 次，"
+                      f"当前速率 {c['rate']:g}/{c['max_rate']:g} QPS")
+        if config.CHAPTER_ASSEMBLY:
+            try:
+                chapter = chapters.assemble_chapter(base_name, voice_name, files)
+                print(f"  已拼接整章：{chapter.data['file']}（{chapter.duration:.0f} 秒）")
+            except (ValueError, OSError) as e:
+                print(f"  拼接整章失败：{e}")
+    return error
+
+
+def main():
+    config.ensure_dirs()
+    name = job_queue.worker_name()
+    conn = job_queue.connect()
+    client = make_client()
+    cache = TTSCache()
+    library = LibraryIndex()
+    scanned_at = 0.0
+    current, stop = {}, threading.Event()
+    threading.Thread(target=_heartbeat_loop, args=(name, current, stop), daemon=True).start()
+    print(f"[{name}] 合成进程已启动，等待任务…")
+
+    try:
+        while True:
+            job_queue.beat(conn, name)
+            job_queue.requeue_stale(conn)
+            if config.PREFETCH_AHEAD > 0 and time.monotonic() - scanned_at >= config.PREFETCH_POLL_SECONDS:
+                # 按播放记录补齐在听的书之后的分段
+                prefetch.scan_records(conn, library.refresh())
+                scanned_at = time.monotonic()
+            job = job_queue.claim_next(conn, name)
+            if not job:
+                time.sleep(config.WORKER_POLL_SECONDS)
+                continue
+            current['id'] = job['id']
+            span = f"（第 {job['first_seg']}–{job['last_seg']} 段）" if job['first_seg'] else ''
+            print(f"[{name}] 开始任务 #{job['id']}：{job['book_file']} / {job['voice_name']}{span}")
+            try:
+                error = run_job(conn, job, client, cache)
+            except Exception as e:
+                error = f"任务异常：{e}"
+            job_queue.finish(conn, job['id'], error)
+            current['id'] = None
+            print(f"[{name}] 任务 #{job['id']} {'失败：' + error if error else '完成'}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        if current.get('id'):
+            # 被中断的任务放回队列，下次由任意 worker 断点续传
+            job_queue.release(conn, current['id'])
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()